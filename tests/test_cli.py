@@ -6,6 +6,8 @@
 
 import json
 import re
+import subprocess
+import sys
 from itertools import combinations
 from datetime import datetime, timedelta
 from dateutil.tz import tzlocal
@@ -563,3 +565,69 @@ def test_report_one_day(runner, timetracker_df):
     assert result.exit_code == 0
     report = json.loads(result.output)
     assert report["time"] == 20001.0
+
+
+def test_report_aligns_tags(runner, timetracker):
+    start = arrow.get(2019, 10, 1, 10, tzinfo=tzlocal())
+    timetracker.add("foo", start, start.shift(hours=1), ["a", "longer"])
+    timetracker.add(
+        "foo", start.shift(hours=2), start.shift(hours=2, minutes=30), ["a"]
+    )
+
+    result = runner.invoke(
+        cli.report, ["-G", "-f", "2019-10-01", "-t", "2019-10-01"], obj=timetracker
+    )
+    assert result.exit_code == 0
+    assert result.output.splitlines()[2:5] == [
+        "foo - 1h 30m 00s",
+        "\t[a       1h 30m 00s]",
+        "\t[longer  1h 00m 00s]",
+    ]
+
+
+# config
+
+
+def test_config_set_and_get(runner, timetracker):
+    result = runner.invoke(cli.config, ["options.pager", "false"], obj=timetracker)
+    assert result.exit_code == 0
+    result = runner.invoke(cli.config, ["options.pager"], obj=timetracker)
+    assert result.output == "false\n"
+
+
+def test_config_set_several_options(runner, timetracker, mocker):
+    safe_save = mocker.patch("xtimetracker.cli.cli.safe_save")
+    result = runner.invoke(
+        cli.config,
+        ["options.pager=false", "options.week_start=monday", "new.option=a=b"],
+        obj=timetracker,
+    )
+    assert result.exit_code == 0
+    assert safe_save.call_count == 1
+    assert timetracker.config.get("options", "pager") == "false"
+    assert timetracker.config.get("options", "week_start") == "monday"
+    assert timetracker.config.get("new", "option") == "a=b"
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["options.pager=false", "options.week_start"],
+        ["options.pager", "false", "extra"],
+        ["pager=false"],
+    ],
+)
+def test_config_set_invalid_arguments(runner, timetracker, args):
+    result = runner.invoke(cli.config, args, obj=timetracker)
+    assert result.exit_code != 0
+
+
+# help
+
+
+def test_help_does_not_import_arrow():
+    code = (
+        "import sys; import xtimetracker.cli; "
+        "sys.exit('arrow' in sys.modules or 'xtimetracker.timetracker' in sys.modules)"
+    )
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0
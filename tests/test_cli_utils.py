@@ -15,23 +15,28 @@ import datetime
 import os
 import pytest
 from io import StringIO
-from dateutil.tz import tzutc
+from dateutil.tz import tzlocal, tzutc
 
 from xtimetracker.cli.utils import (
     apply_weekday_offset,
     build_csv,
     flatten_report_for_csv,
+    format_date,
+    format_seconds,
+    format_timedelta,
     frames_to_csv,
     frames_to_json,
     get_start_time_for_period,
+    iter_csv,
+    parse_date,
     parse_project,
+    parse_project_and_tags,
     parse_tags,
     json_encoder,
 )
 
 from . import mock_datetime
 
-
 _dt = functools.partial(datetime.datetime, tzinfo=tzutc())
 
 
@@ -110,6 +115,22 @@ def test_parse_tags(args, parsed_tags):
     assert tags == parsed_tags
 
 
+# parse_project_and_tags
+
+
+@pytest.mark.parametrize(
+    "args, parsed_project, parsed_tags",
+    [
+        (["+ham", "+n", "+eggs"], "", ["ham", "n", "eggs"]),
+        (["ham", "n", "+eggs"], "ham n", ["eggs"]),
+        (["ham", "+n", "eggs"], "ham", ["n eggs"]),
+        (["ham", "jelly"], "ham jelly", []),
+    ],
+)
+def test_parse_project_and_tags(args, parsed_project, parsed_tags):
+    assert parse_project_and_tags(args) == (parsed_project, parsed_tags)
+
+
 # build_csv
 
 
@@ -148,6 +169,13 @@ def test_build_csv_multiple_cols():
     assert build_csv(data) == result
 
 
+def test_iter_csv():
+    lt = os.linesep
+    data = iter([{"col": "value"}, {"col": "another value"}])
+    assert list(iter_csv(data)) == ["col" + lt + "value" + lt, "another value" + lt]
+    assert list(iter_csv([])) == []
+
+
 # frames_to_csv
 
 
@@ -238,3 +266,42 @@ def test_json_encoder():
 
     now = arrow.utcnow()
     assert json_encoder(now) == now.for_json()
+
+
+# format_seconds
+
+
+@pytest.mark.parametrize(
+    "seconds, expected",
+    [
+        (0, "00s"),
+        (5, "05s"),
+        (59.9, "59s"),
+        (2189, "36m 29s"),
+        (7633, "2h 07m 13s"),
+        (7199.9999999, "2h 00m 00s"),
+        (-65, "-01m 05s"),
+    ],
+)
+def test_format_seconds(seconds, expected):
+    assert format_seconds(seconds) == expected
+    assert format_timedelta(datetime.timedelta(seconds=seconds)) == expected
+
+
+# parse_date
+
+
+def test_parse_date():
+    date = parse_date(" 2019-10-01 10:30:15 ")
+    assert date == arrow.get(2019, 10, 1, 10, 30, 15, tzinfo=tzlocal())
+    assert format_date(date) == "2019-10-01 10:30:15"
+
+    for value in (
+        "2019-10-01 10:30",
+        "2019-1-2 3:4:5",
+        "2019-10-01  10:30:15",
+        "2019-10-01T10:30:15",
+        "2019-13-01 10:30:15",
+    ):
+        with pytest.raises(ValueError):
+            parse_date(value)
@@ -6,6 +6,8 @@
 
 """Unit tests for the 'config' module."""
 
+import io
+
 import pytest
 
 from xtimetracker.cli.utils import create_configuration
@@ -195,3 +197,38 @@ def test_config_set():
     config = create_configuration()
     config.set("foo", "bar", "lol")
     assert config.get("foo", "bar") == "lol"
+
+
+def test_config_set_updates_cached_values():
+    config = create_configuration("[options]\nflag = true\nnumber = 1\n")
+    assert config.getboolean("options", "flag") is True
+    assert config.getint("options", "number") == 1
+
+    config.set("options", "flag", "false")
+    config.set("options", "number", "2")
+    assert config.getboolean("options", "flag") is False
+    assert config.getint("options", "number") == 2
+
+    config.reload("[options]\nnumber = 3\n")
+    assert config.getboolean("options", "flag", True) is True
+    assert config.getint("options", "number") == 3
+
+
+def test_config_read_updates_cached_values(tmpdir):
+    config = create_configuration("[options]\nflag = true\nnumber = 1\n")
+    assert config.getboolean("options", "flag") is True
+    assert config.getlist("options", "number") == ["1"]
+
+    config.read_string("[options]\nflag = false\n")
+    assert config.getboolean("options", "flag") is False
+
+    config.read_dict({"options": {"number": "2 3"}})
+    assert config.getlist("options", "number") == ["2", "3"]
+
+    config.read_file(io.StringIO("[options]\nnumber = 4\n"))
+    assert config.getint("options", "number") == 4
+
+    path = tmpdir.join("config")
+    path.write("[options]\nnumber = 5\n")
+    config.read(str(path))
+    assert config.getint("options", "number") == 5
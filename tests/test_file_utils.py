@@ -11,7 +11,15 @@ from io import StringIO
 
 import pytest
 
-from xtimetracker.file_utils import safe_save, json_writer
+from xtimetracker.file_utils import (
+    safe_save,
+    append_json_lines,
+    json_list_writer,
+    json_writer,
+    load_json,
+    load_json_lines,
+)
+from xtimetracker.utils import TimeTrackerError
 
 
 def test_safe_save(config):
@@ -38,27 +46,106 @@ def test_safe_save(config):
     assert os.path.getmtime(save_file) >= os.path.getmtime(backup_file)
 
 
-def test_safe_save_tmpfile_on_other_filesystem(config, mocker):
+def test_safe_save_tmpfile_in_destination_dir(config, mocker):
     save_file = os.path.join(config.config_dir, "test")
-    backup_file = os.path.join(config.config_dir, "test" + ".bak")
+    replace_mock = mocker.patch("os.replace", side_effect=os.replace)
 
-    assert not os.path.exists(save_file)
     safe_save(save_file, lambda f: f.write("Success"))
-    assert os.path.exists(save_file)
-    assert not os.path.exists(backup_file)
 
-    with open(save_file) as fp:
-        assert fp.read() == "Success"
+    tmp_file = replace_mock.call_args[0][0]
+    assert os.path.dirname(tmp_file) == config.config_dir
+    assert os.listdir(config.config_dir) == ["test"]
 
-    # simulate tmpfile being on another file-system
-    # OSError is caught and handled by shutil.move() used by save_safe()
-    mocker.patch("os.rename", side_effect=OSError)
+
+def test_safe_save_only_replaces_destination(config, mocker):
+    save_file = os.path.join(config.config_dir, "test")
+    backup_file = os.path.join(config.config_dir, "test" + ".bak")
+    safe_save(save_file, "Success")
     safe_save(save_file, "Again")
-    assert os.path.exists(backup_file)
+    replace_mock = mocker.patch("os.replace", side_effect=os.replace)
 
-    with open(save_file) as fp:
+    safe_save(save_file, "Once more")
+
+    # the destination file is never missing
+    assert replace_mock.call_count == 1
+    assert replace_mock.call_args[0][1] == save_file
+    with open(backup_file) as fp:
         assert fp.read() == "Again"
 
+    # without hard links, the backup is a copy
+    mocker.patch("os.link", side_effect=OSError)
+    safe_save(save_file, "Last")
+    with open(backup_file) as fp:
+        assert fp.read() == "Once more"
+    with open(save_file) as fp:
+        assert fp.read() == "Last"
+
+
+def test_safe_save_writes_utf8(config):
+    save_file = os.path.join(config.config_dir, "test")
+    safe_save(save_file, json_writer(lambda: {"ùñï©ôð€": "εvεrywhεrε"}))
+
+    with open(save_file, "rb") as fp:
+        assert fp.read().decode("utf-8") == '{\n "ùñï©ôð€": "εvεrywhεrε"\n}'
+    assert load_json(save_file) == {"ùñï©ôð€": "εvεrywhεrε"}
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_load_json(config, mocker, use_orjson):
+    if not use_orjson:
+        mocker.patch("xtimetracker.file_utils.orjson", None)
+    path = os.path.join(config.config_dir, "test")
+
+    assert load_json(path, type=list) == []
+
+    safe_save(path, "")
+    assert load_json(path, type=list) == []
+
+    safe_save(path, '[[4000, 4010.5, "ùñï", null, []]]')
+    assert load_json(path, type=list) == [[4000, 4010.5, "ùñï", None, []]]
+
+    safe_save(path, "[invalid")
+    with pytest.raises(TimeTrackerError):
+        load_json(path)
+
+
+def test_json_lines(config):
+    path = os.path.join(config.config_dir, "test")
+
+    assert load_json_lines(path) == ([], False)
+
+    append_json_lines(path, [[1, "ùñï"]])
+    append_json_lines(path, [[2, []], [3, None]])
+    assert load_json_lines(path) == ([[1, "ùñï"], [2, []], [3, None]], False)
+
+    # a last line cut short is ignored
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('[4, "ùñ')
+    assert load_json_lines(path) == ([[1, "ùñï"], [2, []], [3, None]], True)
+
+    # even if it holds a valid document, and it is dropped when appending
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('ï", 4]')
+    assert load_json_lines(path) == ([[1, "ùñï"], [2, []], [3, None]], True)
+    append_json_lines(path, [[5]])
+    assert load_json_lines(path) == ([[1, "ùñï"], [2, []], [3, None], [5]], False)
+
+    # a file holding a single line cut short
+    append_json_lines(path, [[6]], truncate=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("[7")
+    assert load_json_lines(path) == ([[6]], True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[7")
+    append_json_lines(path, [[8]])
+    assert load_json_lines(path) == ([[8]], False)
+
+    # any other invalid line is an error
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("\n[5]\n")
+    with pytest.raises(TimeTrackerError):
+        load_json_lines(path)
+
 
 def test_safe_save_with_exception(config):
     save_file = os.path.join(config.config_dir, "test")
@@ -115,3 +202,17 @@ def test_make_json_writer_with_unicode():
     writer(fp)
     expected = '{\n "ùñï©ôð€": "εvεrywhεrε"\n}'
     assert fp.getvalue() == expected
+
+
+def test_make_json_list_writer():
+    fp = StringIO()
+    writer = json_list_writer(lambda: iter([[1, "ùñï"], [2, []]]))
+    writer(fp)
+    assert fp.getvalue() == '[\n[1, "ùñï"],\n[2, []]\n]'
+
+
+def test_make_json_list_writer_empty():
+    fp = StringIO()
+    writer = json_list_writer(lambda: iter([]))
+    writer(fp)
+    assert fp.getvalue() == "[]"
@@ -5,6 +5,7 @@
 # SPDX-License-Identifier: MIT
 
 import arrow
+import pytest
 
 from xtimetracker.frames import Span, Frames, Frame
 
@@ -64,3 +65,130 @@ def test_frames_updated_span():
     f.add("p", "2019-02-01 14:30:00", "2019-02-01 15:30:00")
     assert f.span.start.format("YYYY-MM-DD HH:mm:ss") == "2019-01-01 00:00:00"
     assert f.span.stop.format("YYYY-MM-DD HH:mm:ss") == "2019-02-01 23:59:59"
+
+
+def test_frame_dates_from_timestamps():
+    f = Frame(4000, 4010, "p", "1", updated_at=4020)
+    assert f.start_ts == 4000 and f.stop_ts == 4010
+    assert f.start == arrow.get(4000)
+    assert f.stop == arrow.get(4010)
+    assert f.updated_at == arrow.get(4020)
+    assert f.dump() == (4000, 4010, "p", "1", [], 4020)
+
+
+def test_frames_sort_by_start():
+    first = Frame(4000, 4010, "p", "1")
+    second = Frame(4005, 4006, "p", "2")
+    assert first < second and second > first
+    assert sorted([second, first]) == [first, second]
+
+
+def test_frame_set_date():
+    f = Frame(4000, 4010, "p", "1")
+    f.stop = arrow.get(5000)
+    assert f.stop_ts == 5000
+    assert f.stop == arrow.get(5000)
+
+
+def test_frames_set_and_delete():
+    f = Frames([(4000, 4010, "p1", "a1"), (4020, 4030, "p2", "b2")])
+    f["b2"] = ("p3", 4040, 4050, ["t"])
+    assert f["id"] == ("a1", "b2")
+    assert f["start"] == (arrow.get(4000), arrow.get(4040))
+    assert f[-1].project == "p3" and f[-1].tags == ["t"]
+    del f["a1"]
+    assert len(f) == 1
+    assert [frame.id for frame in f] == ["b2"]
+    assert list(f.ids()) == ["b2"]
+    assert f.dump()[0][:5] == (4040, 4050, "p3", "b2", ["t"])
+
+
+def test_frames_returns_detached_frames():
+    f = Frames([(4000, 4010, "p1", "a1", ["t"])])
+    frame = f[0]
+    frame.stop = 4020
+    frame.tags.append("u")
+    partial = next(f.filter(span=Span(arrow.get(4005), arrow.get(4008), "second")))
+    partial.tags.append("v")
+    f["tags"][0].append("w")
+
+    assert partial.start_ts == 4005 and partial.stop_ts < 4009
+    assert f.dump()[0][:5] == (4000, 4010, "p1", "a1", ["t"])
+
+
+def test_frames_load_shares_strings():
+    frames = Frames(
+        [
+            [4000, 4010, "".join(["fo", "o"]), "id1", ["".join(["A", "B"])]],
+            [4020, 4030, "".join(["f", "oo"]), "id2", ["".join(["A", "B"])]],
+        ]
+    )
+    assert frames[0].project is frames[1].project
+    assert frames[0].tags[0] is frames[1].tags[0]
+
+    frames.add("".join(["fo", "o"]), 4040, 4050, tags=["".join(["A", "B"])])
+    assert frames[2].project is frames[0].project
+    assert frames[2].tags[0] is frames[0].tags[0]
+
+
+def test_frames_get_by_id_after_changes():
+    f = Frames([(4000, 4010, "p1", "abc1"), (4020, 4030, "p2", "abd2")])
+    assert f["abd2"].project == "p2"
+    assert f["ab"].id == "abc1"
+    del f["abc1"]
+    assert f["abd2"].project == "p2"
+    f["xyz3"] = ("p3", 4040, 4050)
+    assert f["xyz"].project == "p3"
+    f[0] = f.new_frame("p4", 4060, 4070, id="new4")
+    assert f["new4"].project == "p4"
+    with pytest.raises(KeyError):
+        f["abd2"]
+
+
+def test_frames_filter_by_span():
+    day = 24 * 3600
+    span = Span(arrow.get(10 * day), arrow.get(10 * day))
+    f = Frames(
+        [
+            (11 * day, 11 * day + 10, "after", "a"),
+            (10 * day + 10, 10 * day + 20, "inside", "b"),
+            (5 * day, 10 * day + 30, "overlaps start", "c"),
+            (9 * day, 9 * day + 10, "before", "d"),
+            (10 * day + 86000, 12 * day, "overlaps stop", "e"),
+        ]
+    )
+    assert [(x.id, x.start_ts, x.stop_ts) for x in f.filter(span=span)] == [
+        ("b", 10 * day + 10, 10 * day + 20),
+        ("c", 10 * day, 10 * day + 30),
+        ("e", 10 * day + 86000, span.stop_ts),
+    ]
+
+    # frames added after the first filter are found, in the order they were added
+    f.add("added", 3 * day, 10 * day + 40, id="f")
+    f.add("added", 10 * day + 50, 10 * day + 60, id="g")
+    assert [x.id for x in f.filter(span=span)] == ["b", "c", "e", "f", "g"]
+
+    del f["c"]
+    f["b"] = ("moved", 9 * day, 9 * day + 10)
+    assert [x.id for x in f.filter(span=span)] == ["e", "f", "g"]
+
+
+def test_frames_get_by_id_prefix():
+    f = Frames([(4000, 4010, "p1", "abz"), (4020, 4030, "p2", "aba")])
+    assert f["ab"].id == "abz"
+    assert f["aba"].id == "aba"
+    f.add("p3", 4040, 4050, id="ab0")
+    f.add("p4", 4060, 4070, id="ac0")
+    assert f["ab"].id == "abz"
+    assert f["ab0"].id == "ab0"
+    assert f["ac"].id == "ac0"
+    with pytest.raises(KeyError):
+        f["abc"]
+
+
+def test_frames_last_stopped():
+    f = Frames()
+    assert f.last_stopped() is None
+    f.add("p", 4000, 4050, id="a")
+    f.add("p", 4010, 4020, id="b")
+    assert f.last_stopped().id == "a"
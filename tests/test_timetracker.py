@@ -8,10 +8,13 @@
 
 import json
 import os
+import shutil
 
 import arrow
 import pytest
 
+from xtimetracker import backend
+from xtimetracker.backend import Backend
 from xtimetracker.timetracker import TimeTracker
 from xtimetracker.utils import TimeTrackerError
 
@@ -23,53 +26,59 @@ def json_mock(mocker):
     return mocker.patch.object(json, "dumps", side_effect=json.dumps, autospec=True)
 
 
+@pytest.fixture
+def data_file(config):
+    """Writes the given content to a file in the configuration directory."""
+
+    def write(name, content):
+        with open(os.path.join(config.config_dir, name), "w") as f:
+            f.write(content)
+
+    return write
+
+
 # NOTE: All timestamps need to be > 3600 to avoid breaking the tests on
 # Windows.
 
 # current
 
 
-def test_current(mocker, timetracker):
+def test_current(data_file, timetracker):
     content = json.dumps({"project": "foo", "start": 4000, "tags": ["A", "B"]})
-    mocker.patch("builtins.open", mocker.mock_open(read_data=content))
+    data_file("state", content)
 
     assert timetracker.current["project"] == "foo"
     assert timetracker.current["start"] == arrow.get(4000)
     assert timetracker.current["tags"] == ["A", "B"]
 
 
-def test_current_with_empty_file(mocker, timetracker):
-    mocker.patch("builtins.open", mocker.mock_open(read_data=""))
-    mocker.patch("os.path.getsize", return_value=0)
+def test_current_with_empty_file(data_file, timetracker):
+    data_file("state", "")
     assert timetracker.current == {}
 
 
-def test_current_with_nonexistent_file(mocker, timetracker):
-    mocker.patch("builtins.open", side_effect=FileNotFoundError)
+def test_current_with_nonexistent_file(timetracker):
     assert timetracker.current == {}
 
 
-def test_current_timetracker_non_valid_json(mocker, timetracker):
-    content = "{'foo': bar}"
-
-    mocker.patch("builtins.open", mocker.mock_open(read_data=content))
-    mocker.patch("os.path.getsize", return_value=len(content))
+def test_current_timetracker_non_valid_json(data_file, timetracker):
+    data_file("state", "{'foo': bar}")
     with pytest.raises(TimeTrackerError):
         timetracker.current
 
 
-def test_current_with_given_state(mocker, timetracker):
+def test_current_with_given_state(data_file, timetracker):
     content = json.dumps({"project": "foo", "start": 4000})
-    mocker.patch("builtins.open", mocker.mock_open(read_data=content))
+    data_file("state", content)
     assert timetracker.current["project"] == "foo"
 
 
 # frames
 
 
-def test_frames(mocker, config):
+def test_frames(data_file, config):
     content = json.dumps([[4000, 4010, "foo", None, ["A", "B", "C"]]])
-    mocker.patch("builtins.open", mocker.mock_open(read_data=content))
+    data_file("frames", content)
 
     timetracker = TimeTracker(config)
     assert timetracker.count() == 1
@@ -81,9 +90,9 @@ def test_frames(mocker, config):
     assert frame.tags == ["A", "B", "C"]
 
 
-def test_frames_without_tags(mocker, config):
+def test_frames_without_tags(data_file, config):
     content = json.dumps([[4000, 4010, "foo", None]])
-    mocker.patch("builtins.open", mocker.mock_open(read_data=content))
+    data_file("frames", content)
 
     timetracker = TimeTracker(config)
     assert timetracker.count() == 1
@@ -95,30 +104,40 @@ def test_frames_without_tags(mocker, config):
     assert frame.tags == []
 
 
-def test_frames_with_empty_file(mocker, timetracker):
-    mocker.patch("builtins.open", mocker.mock_open(read_data=""))
-    mocker.patch("os.path.getsize", return_value=0)
+def test_frames_with_empty_file(data_file, config):
+    data_file("frames", "")
+    timetracker = TimeTracker(config)
     assert timetracker.count() == 0
 
 
-def test_frames_with_nonexistent_file(mocker, timetracker):
-    mocker.patch("builtins.open", side_effect=FileNotFoundError)
+def test_frames_with_nonexistent_file(timetracker):
     assert timetracker.count() == 0
 
 
-def test_frames_timetracker(mocker, config):
-    content = "{'foo': bar}"
-
-    mocker.patch("builtins.open", mocker.mock_open(read_data=content))
-    mocker.patch("os.path.getsize", return_value=len(content))
+def test_frames_timetracker(data_file, config):
+    data_file("frames", "{'foo': bar}")
 
     with pytest.raises(TimeTrackerError):
-        TimeTracker(config)
+        TimeTracker(config).count()
+
 
+def test_frames_loaded_on_demand(data_file, config, mocker):
+    data_file("frames", json.dumps([[4000, 4010, "foo", None, []]]))
+    load_mock = mocker.spy(Backend, "load_frames")
 
-def test_given_frames(config, mocker):
+    timetracker = TimeTracker(config)
+    timetracker.current
+    timetracker.save()
+    assert not load_mock.called
+
+    assert timetracker.count() == 1
+    assert timetracker.count() == 1
+    assert load_mock.call_count == 1
+
+
+def test_given_frames(config, data_file):
     content = json.dumps([[4000, 4010, "bar", None, ["A", "B"]]])
-    mocker.patch("builtins.open", mocker.mock_open(read_data=content))
+    data_file("frames", content)
 
     timetracker = TimeTracker(config)
     assert timetracker.count() == 1
@@ -196,8 +215,9 @@ def test_start_stretch_latest_stop_date(timetracker):
     timetracker.stop()
     foo = timetracker.frames(-2)
     bar = timetracker.frames(-1)
-    bar.start = bar.start.shift(days=-1)
-    bar.stop = bar.stop.shift(days=-1)
+    timetracker.edit(
+        bar.id, bar.project, bar.start.shift(days=-1), bar.stop.shift(days=-1), []
+    )
 
     timetracker.start("foo", stretch=True)
     assert foo.stop == timetracker.current["start"]
@@ -218,6 +238,7 @@ def test_stop_started_project(timetracker):
     assert frame.project == "foo"
     assert isinstance(frame.start, arrow.Arrow)
     assert isinstance(frame.stop, arrow.Arrow)
+    assert frame.updated_at == frame.stop
     assert frame.tags == ["A", "B"]
 
 
@@ -260,18 +281,37 @@ def test_cancel_no_project(timetracker):
 # save
 
 
-def test_save_without_changes(mocker, timetracker, json_mock):
-    mocker.patch("builtins.open", mocker.mock_open())
+def test_save_without_changes(timetracker, json_mock):
     timetracker.save()
 
-    # an empty dict is written as current state
-    assert json_mock.called == 1
+    # the state was neither loaded nor changed, so nothing is written
+    assert not json_mock.called
+
 
+def test_save_keeps_state_not_loaded(timetracker):
+    state_file = os.path.join(timetracker.config.config_dir, "state")
+    with open(state_file, "w") as f:
+        json.dump({"project": "foo", "start": 4000, "tags": []}, f)
 
-def test_save_current(mocker, timetracker, json_mock):
+    timetracker.add(project="bar", tags=[], from_date=6000, to_date=7000)
+    timetracker.save()
+
+    with open(state_file) as f:
+        assert json.load(f)["project"] == "foo"
+
+
+def test_save_unchanged_current(timetracker, json_mock):
+    timetracker.start("foo")
+    timetracker.save()
+    assert json_mock.call_count == 1
+
+    timetracker.save()
+    assert json_mock.call_count == 1
+
+
+def test_save_current(timetracker, json_mock):
     timetracker.start("foo", ["A", "B"])
 
-    mocker.patch("builtins.open", mocker.mock_open())
     timetracker.save()
 
     assert json_mock.call_count == 1
@@ -281,10 +321,9 @@ def test_save_current(mocker, timetracker, json_mock):
     assert result["tags"] == ["A", "B"]
 
 
-def test_save_current_without_tags(mocker, timetracker, json_mock):
+def test_save_current_without_tags(timetracker, json_mock):
     timetracker.start("foo")
 
-    mocker.patch("builtins.open", mocker.mock_open())
     timetracker.save()
 
     assert json_mock.call_count == 1
@@ -297,11 +336,9 @@ def test_save_current_without_tags(mocker, timetracker, json_mock):
     assert dump_args["ensure_ascii"] is False
 
 
-def test_save_empty_current(config, mocker, json_mock):
+def test_save_empty_current(config, json_mock):
     timetracker = TimeTracker(config)
 
-    mocker.patch("builtins.open", mocker.mock_open())
-
     timetracker._current = {"project": "foo", "start": arrow.get(4000)}
     timetracker.save()
 
@@ -317,28 +354,29 @@ def test_save_empty_current(config, mocker, json_mock):
     assert result == {}
 
 
-def test_save_frames_no_change(config, mocker, json_mock):
+def test_save_frames_no_change(config, data_file, json_mock):
     content = json.dumps([[4000, 4010, "bar", None, ["A", "B"]]])
-    mocker.patch("builtins.open", mocker.mock_open(read_data=content))
+    data_file("frames", content)
 
     timetracker = TimeTracker(config)
     timetracker.save()
 
-    # an empty dict is written as current state
-    assert json_mock.called == 1
+    # neither the state nor the frames changed: only the content was dumped
+    assert json_mock.call_count == 1
 
 
-def test_save_added_frame(config, mocker, json_mock):
+def test_save_added_frame(config, data_file, json_mock):
     content = json.dumps([[4000, 4010, "foo", None, None]])
-    mocker.patch("builtins.open", mocker.mock_open(read_data=content))
+    data_file("frames", content)
 
     timetracker = TimeTracker(config)
     timetracker._frames.add("bar", 4010, 4020, ["A"])
     timetracker.save()
 
-    # both frames and state written
-    assert json_mock.call_count == 3
-    result = json_mock.call_args[0][0]
+    # only frames written (streamed, without json.dumps), the state was not loaded
+    assert json_mock.call_count == 1
+    with open(os.path.join(config.config_dir, "frames"), encoding="utf-8") as f:
+        result = json.load(f)
     assert len(result) == 2
     assert result[0][2] == "foo"
     assert result[0][4] == []
@@ -346,39 +384,251 @@ def test_save_added_frame(config, mocker, json_mock):
     assert result[1][4] == ["A"]
 
 
-def test_save_changed_frame(config, mocker, json_mock):
+def test_save_changed_frame(config, data_file, json_mock):
     content = json.dumps([[4000, 4010, "foo", None, ["A"]]])
-    mocker.patch("builtins.open", mocker.mock_open(read_data=content))
+    data_file("frames", content)
 
     timetracker = TimeTracker(config)
-    timetracker._frames[0] = ("bar", 4000, 4010, ["A", "B"])
+    timetracker._frames[0] = ("bar", 4000, 4010, ["A", "Bé"])
     timetracker.save()
 
-    # both frames and state written
-    assert json_mock.call_count == 3
-    result = json_mock.call_args[0][0]
+    # only frames written (streamed, without json.dumps), the state was not loaded
+    assert json_mock.call_count == 1
+    with open(os.path.join(config.config_dir, "frames"), encoding="utf-8") as f:
+        content = f.read()
+    result = json.loads(content)
     assert len(result) == 1
     assert result[0][2] == "bar"
-    assert result[0][4] == ["A", "B"]
+    assert result[0][4] == ["A", "Bé"]
 
-    dump_args = json_mock.call_args[1]
-    assert dump_args["ensure_ascii"] is False
+    # non-ASCII characters are not escaped
+    assert "Bé" in content
 
 
 def test_timetracker_save_calls_safe_save(timetracker, mocker):
     frames_file = os.path.join(timetracker.config.config_dir, "frames")
     timetracker.start("foo", tags=["A", "B"])
+    assert timetracker.count() == 0
     timetracker.stop()
 
     save_mock = mocker.patch("xtimetracker.backend.safe_save")
     timetracker.save()
 
     assert timetracker._frames.changed
-    assert save_mock.call_count == 2
+    # the state is empty again, as it was when loaded
+    assert save_mock.call_count == 1
     assert len(save_mock.call_args[0]) == 2
     assert save_mock.call_args[0][0] == frames_file
 
 
+def test_stop_on_small_frames_file_rewrites_it(config, data_file, mocker):
+    frames_file = os.path.join(config.config_dir, "frames")
+    journal_file = os.path.join(config.config_dir, "frames.journal")
+    data_file("frames", json.dumps([[4000, 4010, "foo", "a" * 32, []]]))
+    load_mock = mocker.spy(Backend, "load_frames")
+
+    timetracker = TimeTracker(config)
+    timetracker.start("bar")
+    timetracker.stop()
+    timetracker.save()
+
+    assert load_mock.call_count == 1
+    assert not os.path.exists(journal_file)
+    with open(frames_file, encoding="utf-8") as f:
+        result = json.load(f)
+    assert [row[2] for row in result] == ["foo", "bar"]
+
+
+def test_stop_does_not_load_frames(config, data_file, mocker):
+    mocker.patch("xtimetracker.backend._JOURNAL_MIN_FRAMES", 1)
+    mocker.patch("xtimetracker.backend._JOURNAL_MAX_FRAMES", 2)
+    frames_file = os.path.join(config.config_dir, "frames")
+    journal_file = os.path.join(config.config_dir, "frames.journal")
+    data_file("frames", json.dumps([[4000, 4010, "foo", "a" * 32, []]]))
+    load_mock = mocker.spy(Backend, "load_frames")
+
+    # the journal is started once the frames are loaded
+    timetracker = TimeTracker(config)
+    timetracker.start("bar", tags=["A"])
+    timetracker.stop()
+    timetracker.save()
+
+    assert load_mock.call_count == 1
+    assert os.path.exists(journal_file)
+
+    timetracker = TimeTracker(config)
+    timetracker.start("baz")
+    frame = timetracker.stop()
+    timetracker.save()
+
+    assert load_mock.call_count == 1
+    timetracker = TimeTracker(config)
+    assert timetracker.frames(-1).id == frame.id
+    assert [f.project for f in timetracker.frames()] == ["foo", "bar", "baz"]
+    assert timetracker.frames(-2).tags == ["A"]
+
+    # frames stopped before loading are seen once loaded
+    timetracker = TimeTracker(config)
+    timetracker.start("qux")
+    frame = timetracker.stop()
+    assert timetracker.count() == 4
+    assert timetracker.frames(-1).id == frame.id
+
+    # the journal is merged into the frames file when it grows too long
+    timetracker = TimeTracker(config)
+    timetracker.start("quux")
+    timetracker.stop()
+    timetracker.save()
+
+    assert not os.path.exists(journal_file)
+    with open(frames_file, encoding="utf-8") as f:
+        result = json.load(f)
+    assert [row[2] for row in result] == ["foo", "bar", "baz", "quux"]
+
+
+def test_save_appends_added_frames_to_journal(config, data_file, mocker):
+    mocker.patch("xtimetracker.backend._JOURNAL_MIN_FRAMES", 1)
+    mocker.patch("xtimetracker.backend._JOURNAL_MAX_FRAMES", 2)
+    frames_file = os.path.join(config.config_dir, "frames")
+    journal_file = os.path.join(config.config_dir, "frames.journal")
+    data_file("frames", json.dumps([[4000, 4010, "foo", "a" * 32, []]]))
+
+    timetracker = TimeTracker(config)
+    timetracker._frames.add("bar", 4010, 4020, ["A"])
+    safe_save_mock = mocker.spy(backend, "safe_save")
+    timetracker.save()
+    timetracker.save()
+
+    # the frames file is not rewritten, nor the frame appended twice
+    assert not safe_save_mock.called
+    with open(journal_file, encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+
+    timetracker = TimeTracker(config)
+    assert [frame.project for frame in timetracker.frames()] == ["foo", "bar"]
+
+    # the journal is merged into the frames file when it grows too long
+    timetracker._frames.add("baz", 4020, 4030)
+    timetracker.save()
+    timetracker._frames.add("qux", 4030, 4040)
+    timetracker.save()
+
+    assert safe_save_mock.call_count == 1
+    assert not os.path.exists(journal_file)
+    with open(frames_file, encoding="utf-8") as f:
+        result = json.load(f)
+    assert [row[2] for row in result] == ["foo", "bar", "baz", "qux"]
+
+
+def test_save_rewrites_changed_journaled_frames(config, data_file, mocker):
+    mocker.patch("xtimetracker.backend._JOURNAL_MIN_FRAMES", 1)
+    frames_file = os.path.join(config.config_dir, "frames")
+    journal_file = os.path.join(config.config_dir, "frames.journal")
+    data_file("frames", json.dumps([[4000, 4010, "foo", "a" * 32, []]]))
+    timetracker = TimeTracker(config)
+    timetracker._frames.add("bar", 4010, 4020)
+    timetracker.save()
+    # the last line was cut short while being appended
+    with open(journal_file, "a", encoding="utf-8") as f:
+        f.write('[4020, 4030, "ba')
+
+    timetracker = TimeTracker(config)
+    frame = timetracker.frames(-1)
+    assert frame.project == "bar"
+    timetracker.edit(frame.id, "baz", frame.start, frame.stop, [])
+    timetracker.save()
+
+    assert not os.path.exists(journal_file)
+    with open(frames_file, encoding="utf-8") as f:
+        result = json.load(f)
+    assert [row[2] for row in result] == ["foo", "baz"]
+
+
+def test_save_ignores_journal_left_by_rewrite(config, data_file, mocker):
+    mocker.patch("xtimetracker.backend._JOURNAL_MIN_FRAMES", 1)
+    journal_file = os.path.join(config.config_dir, "frames.journal")
+    data_file("frames", json.dumps([[4000, 4010, "foo", "a" * 32, []]]))
+    timetracker = TimeTracker(config)
+    timetracker._frames.add("bar", 4010, 4020)
+    timetracker.save()
+
+    # the journaled frame is deleted, but the journal can't be removed
+    timetracker = TimeTracker(config)
+    del timetracker._frames[timetracker.frames(-1).id]
+    remove = os.remove
+
+    def failing_remove(path):
+        if path == journal_file:
+            raise OSError
+        remove(path)
+
+    remove_mock = mocker.patch("os.remove", side_effect=failing_remove)
+    with pytest.raises(TimeTrackerError):
+        timetracker.save()
+    mocker.stop(remove_mock)
+    with open(os.path.join(config.config_dir, "frames"), encoding="utf-8") as f:
+        assert [row[2] for row in json.load(f)] == ["foo"]
+
+    assert os.path.exists(journal_file)
+    timetracker = TimeTracker(config)
+    assert [frame.project for frame in timetracker.frames()] == ["foo"]
+
+    # the stale journal is removed by the next save
+    timetracker._frames.add("baz", 4020, 4030)
+    timetracker.save()
+    assert not os.path.exists(journal_file)
+    timetracker = TimeTracker(config)
+    assert [frame.project for frame in timetracker.frames()] == ["foo", "baz"]
+
+
+def test_load_keeps_journal_of_copied_frames_file(config, data_file, mocker, tmpdir):
+    mocker.patch("xtimetracker.backend._JOURNAL_MIN_FRAMES", 1)
+    frames_file = os.path.join(config.config_dir, "frames")
+    data_file("frames", json.dumps([[4000, 4010, "foo", "a" * 32, []]]))
+    timetracker = TimeTracker(config)
+    timetracker._frames.add("bar", 4010, 4020)
+    timetracker.save()
+
+    os.utime(frames_file, (0, 0))
+    assert TimeTracker(config).count() == 2
+
+    copy_dir = str(tmpdir.join("copy"))
+    shutil.copytree(config.config_dir, copy_dir)
+    assert len(Backend(copy_dir).load_frames()) == 2
+
+
+def test_load_merges_journal_of_edited_frames_file(config, data_file, mocker):
+    mocker.patch("xtimetracker.backend._JOURNAL_MIN_FRAMES", 1)
+    frames_file = os.path.join(config.config_dir, "frames")
+    journal_file = os.path.join(config.config_dir, "frames.journal")
+    data_file("frames", json.dumps([[4000, 4010, "foo", "a" * 32, []]]))
+    timetracker = TimeTracker(config)
+    timetracker._frames.add("bar", 4010, 4020)
+    timetracker._frames.add("baz", 4020, 4030)
+    timetracker.save()
+    baz_id = timetracker.frames(-1).id
+
+    # edited by hand, including one of the journaled frames
+    data_file(
+        "frames",
+        json.dumps(
+            [[4000, 4010, "foo", "a" * 32, []], [4020, 4030, "qux", baz_id, []]]
+        ),
+    )
+
+    timetracker = TimeTracker(config)
+    assert [frame.project for frame in timetracker.frames()] == ["foo", "qux", "bar"]
+    assert os.path.exists(journal_file)
+
+    # the next save merges the journal into the frames file
+    timetracker._frames.add("quux", 4030, 4040)
+    timetracker.save()
+    assert not os.path.exists(journal_file)
+    with open(frames_file, encoding="utf-8") as f:
+        result = json.load(f)
+    assert [row[2] for row in result] == ["foo", "qux", "bar", "quux"]
+
+
 # report
 
 
@@ -446,7 +696,7 @@ def test_report(timetracker):
         (3600 * 48, 3600.0),
     ),
 )
-def test_report_include_partial_frames(mocker, config, date_as_unixtime, sum_):
+def test_report_include_partial_frames(data_file, config, date_as_unixtime, sum_):
     """Test report building with frames that cross report boundaries
 
     1 event is added that has 2 hours in one day and 1 in the next.
@@ -463,7 +713,7 @@ def test_report_include_partial_frames(mocker, config, date_as_unixtime, sum_):
             ]
         ]
     )
-    mocker.patch("builtins.open", mocker.mock_open(read_data=content))
+    data_file("frames", content)
 
     timetracker = TimeTracker(config)
     date = arrow.get(date_as_unixtime)
@@ -471,6 +721,50 @@ def test_report_include_partial_frames(mocker, config, date_as_unixtime, sum_):
     assert report["time"] == pytest.approx(sum_, abs=1e-3)
 
 
+def test_report_timespan_starts_at_period(timetracker):
+    now = arrow.now()
+    year = now.floor("year")
+
+    report = timetracker.report(now.shift(days=-7), now, year=year)
+    assert report["timespan"]["from"] == year
+    assert report["timespan"]["to"] == now.ceil("day")
+
+
+@pytest.mark.parametrize("current", [None, True])
+def test_report_does_not_store_current_frame(timetracker, current):
+    timetracker.config.set("options", "include_current", "true")
+    timetracker.start("foo", ["A"])
+    now = arrow.now()
+
+    report = timetracker.report(now.shift(days=-1), now, current=current)
+    assert [p["name"] for p in report["projects"]] == ["foo"]
+    reports = timetracker.aggregate(now.shift(days=-1), now, current=current)
+    assert [p["name"] for p in reports[-1]["projects"]] == ["foo"]
+
+    assert timetracker.count() == 0
+    assert timetracker.projects() == []
+
+
+# aggregate
+
+
+def test_aggregate_splits_frames_by_day(timetracker):
+    day = arrow.get("2019-10-31T00:00:00").replace(tzinfo="local")
+    timetracker.add("foo", day.shift(hours=22), day.shift(hours=26), ["A"])
+    timetracker.add("bar", day.shift(hours=30), day.shift(hours=31), [])
+
+    reports = timetracker.aggregate(day, day.shift(days=2))
+
+    assert [r["timespan"]["from"] for r in reports] == [
+        day,
+        day.shift(days=1),
+        day.shift(days=2),
+    ]
+    assert [r["time"] for r in reports] == pytest.approx([7200, 10800, 0])
+    assert [p["name"] for p in reports[1]["projects"]] == ["bar", "foo"]
+    assert reports[1]["projects"][1]["tags"] == [{"name": "A", "time": 7200.0}]
+
+
 # add
 
 
@@ -543,3 +837,20 @@ def test_get_last_frame_from_project(timetracker_df):
     frame = timetracker_df.get_latest_frame("hubble")
     assert frame.project == "hubble"
     assert set(frame.tags) == {"transmission", "camera"}
+
+
+# projects and tags
+
+
+def test_projects_and_tags_follow_frame_changes(timetracker):
+    f = timetracker.add(project="foo", tags=["a"], from_date=6000, to_date=7000)
+    assert timetracker.projects() == ["foo"]
+    assert timetracker.tags() == ["a"]
+
+    timetracker.add(project="bar", tags=["b"], from_date=7000, to_date=8000)
+    assert timetracker.projects() == ["bar", "foo"]
+    assert timetracker.tags(projects=["bar"]) == ["b"]
+
+    timetracker.edit(f.id, "baz", f.start, f.stop, ["c"])
+    assert timetracker.projects() == ["bar", "baz"]
+    assert timetracker.tags() == ["b", "c"]
@@ -5,12 +5,56 @@
 import os
 import arrow
 from dateutil import tz
-from typing import Optional
+from typing import List, Optional, Tuple
 
-from .frames import Frames
-from .file_utils import safe_save, json_writer, load_json
+from .frames import Frame, Frames
+from .file_utils import (
+    safe_save,
+    append_json_lines,
+    json_list_writer,
+    json_writer,
+    load_json,
+    load_json_lines,
+)
 from .utils import TimeTrackerError
 
+# new frames are appended to the journal once the frames file holds this many
+# frames, below that rewriting the whole file is cheap enough (also when saving
+# stopped frames: a journal is only started once the frames are loaded)
+_JOURNAL_MIN_FRAMES = 1000
+# the journal is merged back into the frames file when it would grow past this
+_JOURNAL_MAX_FRAMES = 200
+# appended to the journal before merging it into the frames file
+_JOURNAL_MERGED = {"merged": True}
+
+
+def _file_hash(path: str) -> Optional[str]:
+    """
+    Return a hash of the contents of the given file, or None if it doesn't
+    exist.
+    """
+    # only needed once the frames are journaled, don't import it on startup
+    import hashlib
+
+    sha = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                sha.update(block)
+    except FileNotFoundError:
+        return None
+    return sha.hexdigest()
+
+
+def _state_key(raw_state: dict) -> tuple:
+    """
+    Return a hashable key identifying the contents of a raw state, so that
+    saving can tell whether the state file is already up to date.
+    """
+    if not raw_state:
+        return ()
+    return (raw_state["project"], raw_state["start"], tuple(raw_state["tags"]))
+
 
 class Backend:
     """
@@ -20,15 +64,27 @@ class Backend:
     def __init__(self, data_dir: str):
         self._frames_file = os.path.join(data_dir, "frames")
         self._state_file = os.path.join(data_dir, "state")
-        self._last_state: Optional[dict] = None
+        self._journal_file = os.path.join(data_dir, "frames.journal")
+        self._last_state_key: Optional[tuple] = None
+        # number of frames in the journal file
+        self._journal_len = 0
 
-    def save(self, state: dict, frames: Frames):
+    def save(self, state: Optional[dict], frames: Optional[Frames]):
         """
         Save the state in the appropriate files. Create them if necessary.
+
+        The state file is only written when its contents differ from the ones
+        last loaded or saved. A `None` state that was never loaded is left
+        untouched, and so are `None` (not loaded) frames.
+
+        When frames have only been added to a large frames file, they are
+        appended to the journal file instead of rewriting the frames file.
+        Otherwise, or when the journal grows too long, the frames file is
+        rewritten with all the frames and the journal removed.
         """
         try:
-            if self._last_state is None or state != self._last_state:
-                if state is not None:
+            if state is not None or self._last_state_key is not None:
+                if state:
                     raw_state = {
                         "project": state["project"],
                         "start": state["start"].timestamp,
@@ -36,12 +92,108 @@ class Backend:
                     }
                 else:
                     raw_state = {}
-                safe_save(self._state_file, json_writer(lambda: raw_state))
-                self._last_state = state
+
+                state_key = _state_key(raw_state)
+                if state_key != self._last_state_key:
+                    safe_save(self._state_file, json_writer(lambda: raw_state))
+                    self._last_state_key = state_key
 
             if frames is not None and frames.changed:
-                safe_save(self._frames_file, json_writer(frames.dump))
+                self._save_frames(frames)
+
+        except OSError as e:
+            raise TimeTrackerError("Error writing file '{}': {}".format(e.filename, e))
+
+    def _save_frames(self, frames: Frames):
+        rows = frames.unsaved_rows()
+        if rows == []:
+            # already saved
+            return
+        if (
+            rows is not None
+            and len(frames) - len(rows) >= _JOURNAL_MIN_FRAMES
+            and self._journal_len + len(rows) <= _JOURNAL_MAX_FRAMES
+        ):
+            self._append_journal(rows)
+        else:
+            if os.path.exists(self._journal_file):
+                # if the journal can't be removed once the frames file is
+                # replaced, its frames must not be merged again: some of them
+                # may have been removed
+                append_json_lines(self._journal_file, [_JOURNAL_MERGED])
+                self._journal_len = _JOURNAL_MAX_FRAMES + 1
+            safe_save(self._frames_file, json_list_writer(frames.iter_dump))
+            try:
+                os.remove(self._journal_file)
+            except FileNotFoundError:
+                pass
+            self._journal_len = 0
+        frames.mark_saved()
+
+    def _append_journal(self, rows: list):
+        if self._journal_len == 0:
+            # a new journal starts with the contents of the frames file it
+            # extends, so that it's known once that file is replaced
+            header = {"frames": _file_hash(self._frames_file)}
+            append_json_lines(self._journal_file, [header] + rows, truncate=True)
+        else:
+            append_json_lines(self._journal_file, rows)
+        self._journal_len += len(rows)
 
+    def _load_journal(self) -> Tuple[list, bool]:
+        """
+        Return the frames in the journal, and whether the journal extends the
+        current frames file, and set the journal length.
+        """
+        items, truncated = load_json_lines(self._journal_file)
+        if not items:
+            self._journal_len = _JOURNAL_MAX_FRAMES + 1 if truncated else 0
+            return [], True
+        rows = [item for item in items[1:] if item != _JOURNAL_MERGED]
+        merged = len(rows) < len(items) - 1
+        if items[0] == {"frames": _file_hash(self._frames_file)}:
+            # appending after a cut short line would corrupt the journal, and
+            # an interrupted merge must be retried, do it on the next save
+            stale = truncated or merged
+            self._journal_len = _JOURNAL_MAX_FRAMES + 1 if stale else len(rows)
+            return rows, True
+        # the frames file was replaced: by a merge that could not remove the
+        # journal, or otherwise (e.g. edited by hand), in which case any
+        # frame missing from it is merged on the next save
+        self._journal_len = _JOURNAL_MAX_FRAMES + 1
+        if merged:
+            return [], False
+        if not isinstance(items[0], dict):
+            rows = items
+        return rows, False
+
+    def append_frames(self, frames: List[Frame]):
+        """
+        Save the given new frames without loading the stored ones, appending
+        them to the journal file. If there is no journal yet or it would grow
+        too long, all the frames are loaded and saved as usual instead.
+        """
+        try:
+            journal, current = self._load_journal()
+            # a journal is only started for a frames file large enough
+            if (
+                not journal
+                or not current
+                or self._journal_len + len(frames) > _JOURNAL_MAX_FRAMES
+            ):
+                all_frames = self.load_frames()
+                for frame in frames:
+                    all_frames.add(
+                        frame.project,
+                        frame.start_ts,
+                        frame.stop_ts,
+                        tags=frame.tags,
+                        id=frame.id,
+                        updated_at=frame.updated_at_ts,
+                    )
+                self._save_frames(all_frames)
+            else:
+                self._append_journal([frame.dump() for frame in frames])
         except OSError as e:
             raise TimeTrackerError("Error writing file '{}': {}".format(e.filename, e))
 
@@ -49,16 +201,28 @@ class Backend:
         raw_state = load_json(self._state_file)
 
         if not raw_state or "project" not in raw_state:
-            self._last_state = {}
-            return self._last_state
+            self._last_state_key = _state_key({})
+            return {}
 
-        self._last_state = {
+        state = {
             "project": raw_state["project"],
             "start": arrow.get(raw_state["start"], tzinfo=tz.tzlocal()),
             "tags": raw_state.get("tags") or [],
         }
-        return self._last_state
+        self._last_state_key = _state_key(
+            {
+                "project": state["project"],
+                "start": raw_state["start"],
+                "tags": state["tags"],
+            }
+        )
+        return state
 
     def load_frames(self) -> Frames:
         raw_frames = load_json(self._frames_file, type=list)
+        journal, current = self._load_journal()
+        if not current:
+            ids = set(row[3] for row in raw_frames)
+            journal = [row for row in journal if row[3] not in ids]
+        raw_frames.extend(journal)
         return Frames(raw_frames)
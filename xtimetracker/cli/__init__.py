@@ -6,6 +6,7 @@ from . import cli
 from .add import add
 from .cancel import cancel
 from .cli import aggregate
+from .cli import config
 from .cli import log
 from .cli import report
 from .constants import SHORTCUT_OPTIONS
@@ -15,8 +15,7 @@ from .utils import (
     DateTime,
     catch_timetracker_error,
     style,
-    parse_project,
-    parse_tags,
+    parse_project_and_tags,
 )
 
 if TYPE_CHECKING:
@@ -46,13 +45,10 @@ def add(tt: TimeTracker, args, from_, to):
     """
     Add time to a project with tag(s) that was not tracked live.
     """
-    project = parse_project(args)
+    project, tags = parse_project_and_tags(args)
     if not project:
         raise click.ClickException("No project given.")
 
-    # Parse all the tags
-    tags = parse_tags(args)
-
     # add a new frame, call timetracker save to update state files
     frame = tt.add(project=project, tags=tags, from_date=from_, to_date=to)
 
@@ -4,14 +4,11 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 # SPDX-License-Identifier: MIT
 
-import datetime
+import itertools
 import json
 import operator
-from functools import reduce
 
-import arrow
 import click
-from dateutil import tz
 
 from .. import __version__
 from .autocompletion import (
@@ -20,7 +17,6 @@ from .autocompletion import (
     get_tags,
 )
 from ..file_utils import safe_save
-from ..frames import Frame
 from .constants import SHORTCUT_OPTIONS
 from .utils import (
     DateTime,
@@ -32,24 +28,25 @@ from .utils import (
     create_timetracker,
     flatten_report_for_csv,
     format_date,
+    format_seconds,
     format_timedelta,
     frames_to_csv,
     frames_to_json,
-    get_start_time_for_period,
+    iter_csv,
+    Period,
     style,
     parse_date,
 )
-from ..utils import sorted_groupby
 
 
 class MutuallyExclusiveOption(click.Option):
     def __init__(self, *args, **kwargs):
-        self.mutually_exclusive = set(kwargs.pop("mutually_exclusive", []))
+        self.mutually_exclusive = frozenset(kwargs.pop("mutually_exclusive", ()))
         super().__init__(*args, **kwargs)
 
     def handle_parse_result(self, ctx, opts, args):
         if self.name in opts:
-            if self.mutually_exclusive.intersection(opts):
+            if not self.mutually_exclusive.isdisjoint(opts):
                 self._raise_exclusive_error()
             if self.multiple and len(set(opts[self.name])) > 1:
                 self._raise_exclusive_error()
@@ -58,15 +55,13 @@ class MutuallyExclusiveOption(click.Option):
     def _raise_exclusive_error(self):
         # Use self.opts[-1] instead of self.name to handle options with a
         # different internal name.
-        self.mutually_exclusive.add(self.opts[-1].strip("-"))
+        options = self.mutually_exclusive | {self.opts[-1].strip("-")}
         raise click.ClickException(
             style(
                 "error",
                 "The following options are mutually exclusive: "
                 "{options}".format(
-                    options=", ".join(
-                        ["`--{}`".format(_) for _ in self.mutually_exclusive]
-                    )
+                    options=", ".join(["`--{}`".format(_) for _ in options])
                 ),
             )
         )
@@ -74,6 +69,20 @@ class MutuallyExclusiveOption(click.Option):
 
 CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
 
+# number of lines written at once when the output is not paged
+_ECHO_BATCH_SIZE = 500
+
+
+# arrow is imported by the commands that use it, not to show the help
+def _now():
+    import arrow
+
+    return arrow.now()
+
+
+def _week_ago():
+    return _now().shift(days=-7)
+
 
 @click.group(invoke_without_command=True, context_settings=CONTEXT_SETTINGS)
 @click.version_option(version=__version__, prog_name="x")
@@ -92,9 +101,6 @@ def cli(ctx):
         ctx.invoke(status)
 
 
-_SHORTCUT_OPTIONS_VALUES = {k: get_start_time_for_period(k) for k in SHORTCUT_OPTIONS}
-
-
 @cli.command()
 @click.option(
     "-c/-C",
@@ -109,7 +115,7 @@ _SHORTCUT_OPTIONS_VALUES = {k: get_start_time_for_period(k) for k in SHORTCUT_OP
     "from_",
     cls=MutuallyExclusiveOption,
     type=DateTime,
-    default=arrow.now().shift(days=-7),
+    default=_week_ago,
     mutually_exclusive=SHORTCUT_OPTIONS,
     help="Report start date. Default: 7 days ago.",
 )
@@ -118,7 +124,7 @@ _SHORTCUT_OPTIONS_VALUES = {k: get_start_time_for_period(k) for k in SHORTCUT_OP
     "--to",
     cls=MutuallyExclusiveOption,
     type=DateTime,
-    default=arrow.now(),
+    default=_now,
     mutually_exclusive=SHORTCUT_OPTIONS,
     help="Report stop date (inclusive). Default: tomorrow.",
 )
@@ -126,8 +132,8 @@ _SHORTCUT_OPTIONS_VALUES = {k: get_start_time_for_period(k) for k in SHORTCUT_OP
     "-y",
     "--year",
     cls=MutuallyExclusiveOption,
-    type=DateTime,
-    flag_value=_SHORTCUT_OPTIONS_VALUES["year"],
+    type=Period,
+    flag_value="year",
     mutually_exclusive=["day", "week", "month", "full"],
     help="Report current year.",
 )
@@ -135,8 +141,8 @@ _SHORTCUT_OPTIONS_VALUES = {k: get_start_time_for_period(k) for k in SHORTCUT_OP
     "-m",
     "--month",
     cls=MutuallyExclusiveOption,
-    type=DateTime,
-    flag_value=_SHORTCUT_OPTIONS_VALUES["month"],
+    type=Period,
+    flag_value="month",
     mutually_exclusive=["day", "week", "year", "full"],
     help="Report current month.",
 )
@@ -144,8 +150,8 @@ _SHORTCUT_OPTIONS_VALUES = {k: get_start_time_for_period(k) for k in SHORTCUT_OP
     "-w",
     "--week",
     cls=MutuallyExclusiveOption,
-    type=DateTime,
-    flag_value=_SHORTCUT_OPTIONS_VALUES["week"],
+    type=Period,
+    flag_value="week",
     mutually_exclusive=["day", "month", "year", "full"],
     help="Report current week.",
 )
@@ -153,8 +159,8 @@ _SHORTCUT_OPTIONS_VALUES = {k: get_start_time_for_period(k) for k in SHORTCUT_OP
     "-d",
     "--day",
     cls=MutuallyExclusiveOption,
-    type=DateTime,
-    flag_value=_SHORTCUT_OPTIONS_VALUES["day"],
+    type=Period,
+    flag_value="day",
     mutually_exclusive=["week", "month", "year", "full"],
     help="Report current day.",
 )
@@ -163,8 +169,8 @@ _SHORTCUT_OPTIONS_VALUES = {k: get_start_time_for_period(k) for k in SHORTCUT_OP
     "--full",
     "full",
     cls=MutuallyExclusiveOption,
-    type=DateTime,
-    flag_value=_SHORTCUT_OPTIONS_VALUES["full"],
+    type=Period,
+    flag_value="full",
     mutually_exclusive=["day", "week", "month", "year"],
     help="Report full interval.",
 )
@@ -255,20 +261,12 @@ def report(
     full,
     output_format,
     pager,
-    aggregated=False,
 ):
     """
     Display a report of the time spent on each project.
 
     By default, the time spent the last 7 days is printed.
     """
-    # if the report is an aggregate report, add whitespace using this
-    # aggregate tab which will be prepended to the project name
-    if aggregated:
-        tab = "  "
-    else:
-        tab = ""
-
     report = timetracker.report(
         from_,
         to,
@@ -284,120 +282,106 @@ def report(
         full=full,
     )
 
-    if "json" in output_format and not aggregated:
+    if "json" in output_format:
         click.echo(build_json(report))
         return
-    elif "csv" in output_format and not aggregated:
+    elif "csv" in output_format:
         click.echo(build_csv(flatten_report_for_csv(report)))
         return
-    elif "plain" not in output_format and aggregated:
-        return report
 
-    lines = []
     # use the pager, or print directly to the terminal
-    if pager or (
-        pager is None and timetracker.config.getboolean("options", "pager", True)
-    ):
+    _echo_lines(
+        _render_report(report),
+        pager
+        or (pager is None and timetracker.config.getboolean("options", "pager", True)),
+    )
 
-        def _print(line):
-            lines.append(line)
 
-        def _final_print(lines):
-            click.echo_via_pager("\n".join(lines))
+def _echo_lines(lines, pager, sep="\n"):
+    """
+    Print the given lines separated by `sep`, through the pager if requested.
 
-    elif aggregated:
+    Lines are written as they are generated instead of joining them first.
+    Without the pager, they are written in batches to avoid one write and
+    flush per line.
+    """
+    chunks = (sep + line if i else line for i, line in enumerate(lines))
+    if pager:
+        click.echo_via_pager(chunks)
+        return
 
-        def _print(line):
-            lines.append(line)
+    written = False
+    while True:
+        batch = list(itertools.islice(chunks, _ECHO_BATCH_SIZE))
+        if not batch:
+            break
+        click.echo("".join(batch), nl=False)
+        written = True
+    if written:
+        click.echo()
 
-        def _final_print(lines):
-            pass
 
+def _render_report(report, aggregated=False):
+    """
+    Yield the lines of a plain text report. Aggregated reports (one for each
+    day) have a shorter title, indented projects and no total.
+    """
+    # if the report is an aggregate report, add whitespace using this
+    # aggregate tab which will be prepended to the project name
+    if aggregated:
+        tab = "  "
     else:
-
-        def _print(line):
-            click.echo(line)
-
-        def _final_print(lines):
-            pass
+        tab = ""
 
     # handle special title formatting for aggregate reports
     if aggregated:
-        _print(
-            "{} - {}".format(
-                style("date", "{:ddd DD MMMM YYYY}".format(report["timespan"]["from"])),
-                style(
-                    "time",
-                    "{}".format(
-                        format_timedelta(datetime.timedelta(seconds=report["time"]))
-                    ),
-                ),
-            )
+        yield "{} - {}".format(
+            style("date", "{:ddd DD MMMM YYYY}".format(report["timespan"]["from"])),
+            style(
+                "time",
+                "{}".format(format_seconds(report["time"])),
+            ),
         )
 
     else:
-        _print(
-            "{} -> {}\n".format(
-                style("date", "{:ddd DD MMMM YYYY}".format(report["timespan"]["from"])),
-                style("date", "{:ddd DD MMMM YYYY}".format(report["timespan"]["to"])),
-            )
+        yield "{} -> {}\n".format(
+            style("date", "{:ddd DD MMMM YYYY}".format(report["timespan"]["from"])),
+            style("date", "{:ddd DD MMMM YYYY}".format(report["timespan"]["to"])),
         )
 
     projects = report["projects"]
 
     for project in projects:
-        _print(
-            "{tab}{project} - {time}".format(
-                tab=tab,
-                time=style(
-                    "time",
-                    format_timedelta(datetime.timedelta(seconds=project["time"])),
-                ),
-                project=style("project", project["name"]),
-            )
+        yield "{tab}{project} - {time}".format(
+            tab=tab,
+            time=style(
+                "time",
+                format_seconds(project["time"]),
+            ),
+            project=style("project", project["name"]),
         )
 
         tags = project["tags"]
         if tags:
-            longest_tag = max(len(tag) for tag in tags or [""])
+            longest_tag = max(len(tag["name"]) for tag in tags)
 
             for tag in tags:
-                _print(
-                    "\t[{tag} {time}]".format(
-                        time=style(
-                            "time",
-                            "{:>11}".format(
-                                format_timedelta(
-                                    datetime.timedelta(seconds=tag["time"])
-                                )
-                            ),
-                        ),
-                        tag=style("tag", "{:<{}}".format(tag["name"], longest_tag)),
-                    )
+                yield "\t[{tag} {time}]".format(
+                    time=style("time", format_seconds(tag["time"]).rjust(11)),
+                    tag=style("tag", tag["name"].ljust(longest_tag)),
                 )
-        _print("")
+        yield ""
 
     # only show total time at the bottom for a project if it is not
     # an aggregate report and there is greater than 1 project
     if len(projects) > 1 and not aggregated:
-        _print(
-            "Total: {}".format(
-                style(
-                    "time",
-                    "{}".format(
-                        format_timedelta(datetime.timedelta(seconds=report["time"]))
-                    ),
-                )
+        yield "Total: {}".format(
+            style(
+                "time",
+                "{}".format(format_seconds(report["time"])),
             )
         )
 
-    # if this is a report invoked from `aggregate`
-    # return the lines
-    if aggregated:
-        return lines
-    else:
-        _final_print(lines)
-
 
 @cli.command()
 @click.option(
@@ -413,7 +397,7 @@ def report(
     "from_",
     cls=MutuallyExclusiveOption,
     type=DateTime,
-    default=arrow.now().shift(days=-7),
+    default=_week_ago,
     mutually_exclusive=SHORTCUT_OPTIONS,
     help="Report start date. Default: 7 days ago.",
 )
@@ -422,7 +406,7 @@ def report(
     "--to",
     cls=MutuallyExclusiveOption,
     type=DateTime,
-    default=arrow.now(),
+    default=_now,
     mutually_exclusive=SHORTCUT_OPTIONS,
     help="Report stop date (inclusive). Default: tomorrow.",
 )
@@ -498,10 +482,8 @@ def report(
     help="(Don't) view output through a pager.",
 )
 @click.pass_obj
-@click.pass_context
 @catch_timetracker_error
 def aggregate(
-    ctx,
     timetracker,
     include_current,
     from_,
@@ -519,47 +501,42 @@ def aggregate(
     By default, the time spent the last 7 days is printed.
     """
     from_, to = adjusted_span(timetracker, from_, to, include_current)
-    delta = (to.datetime - from_.datetime).days
-    lines = []
-    for i in range(delta + 1):
-        offset = datetime.timedelta(days=i)
-        from_offset = from_ + offset
-        output = ctx.invoke(
-            report,
-            current=include_current,
-            from_=from_offset,
-            to=from_offset,
-            projects=projects,
-            exclude_projects=exclude_projects,
-            tags=tags,
-            exclude_tags=exclude_tags,
-            output_format=output_format,
-            pager=pager,
-            aggregated=True,
-        )
+    reports = timetracker.aggregate(
+        from_,
+        to,
+        include_current,
+        projects,
+        tags,
+        exclude_projects,
+        exclude_tags,
+    )
 
-        if "json" in output_format:
-            lines.append(output)
-        elif "csv" in output_format:
-            lines.extend(flatten_report_for_csv(output))
-        else:
+    if "json" in output_format:
+        click.echo(build_json(reports))
+        return
+    elif "csv" in output_format:
+        # the rows are written as they are built, the trailing empty chunk
+        # keeps the final empty line of click.echo(build_csv(...))
+        rows = (line for report in reports for line in flatten_report_for_csv(report))
+        _echo_lines(itertools.chain(iter_csv(rows), [""]), False, sep="")
+        return
+
+    def _days():
+        for report in reports:
+            output = list(_render_report(report, aggregated=True))
             # if there is no activity for the day, append a newline
             # this ensures even spacing throughout the report
-            if (len(output)) == 1:
+            if len(output) == 1:
                 output[0] += "\n"
 
-            lines.append("\n".join(output))
+            yield "\n".join(output)
 
-    if "json" in output_format:
-        click.echo(build_json(lines))
-    elif "csv" in output_format:
-        click.echo(build_csv(lines))
-    elif pager or (
-        pager is None and timetracker.config.getboolean("options", "pager", True)
-    ):
-        click.echo_via_pager("\n\n".join(lines))
-    else:
-        click.echo("\n\n".join(lines))
+    _echo_lines(
+        _days(),
+        pager
+        or (pager is None and timetracker.config.getboolean("options", "pager", True)),
+        sep="\n\n",
+    )
 
 
 @cli.command()
@@ -575,22 +552,22 @@ def aggregate(
     "--from",
     "from_",
     type=DateTime,
-    default=arrow.now().shift(days=-7),
+    default=_week_ago,
     help="Log start date. Default: 7 days ago.",
 )
 @click.option(
     "-t",
     "--to",
     type=DateTime,
-    default=arrow.now(),
+    default=_now,
     help="Log stop date (inclusive). Default: tomorrow.",
 )
 @click.option(
     "-y",
     "--year",
     cls=MutuallyExclusiveOption,
-    type=DateTime,
-    flag_value=_SHORTCUT_OPTIONS_VALUES["year"],
+    type=Period,
+    flag_value="year",
     mutually_exclusive=["day", "week", "month", "full"],
     help="Report current year.",
 )
@@ -598,8 +575,8 @@ def aggregate(
     "-m",
     "--month",
     cls=MutuallyExclusiveOption,
-    type=DateTime,
-    flag_value=_SHORTCUT_OPTIONS_VALUES["month"],
+    type=Period,
+    flag_value="month",
     mutually_exclusive=["day", "week", "year", "full"],
     help="Report current month.",
 )
@@ -607,8 +584,8 @@ def aggregate(
     "-w",
     "--week",
     cls=MutuallyExclusiveOption,
-    type=DateTime,
-    flag_value=_SHORTCUT_OPTIONS_VALUES["week"],
+    type=Period,
+    flag_value="week",
     mutually_exclusive=["day", "month", "year", "full"],
     help="Report current week.",
 )
@@ -616,8 +593,8 @@ def aggregate(
     "-d",
     "--day",
     cls=MutuallyExclusiveOption,
-    type=DateTime,
-    flag_value=_SHORTCUT_OPTIONS_VALUES["day"],
+    type=Period,
+    flag_value="day",
     mutually_exclusive=["week", "month", "year", "full"],
     help="Report current day.",
 )
@@ -626,8 +603,8 @@ def aggregate(
     "--full",
     "full",
     cls=MutuallyExclusiveOption,
-    type=DateTime,
-    flag_value=_SHORTCUT_OPTIONS_VALUES["full"],
+    type=Period,
+    flag_value="full",
     mutually_exclusive=["day", "week", "month", "year"],
     help="Report full interval.",
 )
@@ -748,65 +725,44 @@ def log(
         click.echo(frames_to_csv(filtered_frames))
         return
 
-    frames_by_day = sorted_groupby(
-        filtered_frames, lambda frame: frame.start.floor("day"), reverse=True
-    )
+    frames_by_day = {}
+    for frame in filtered_frames:
+        frames_by_day.setdefault(frame.start.date(), []).append(frame)
 
-    lines = []
-    # use the pager, or print directly to the terminal
-    if pager or (
-        pager is None and timetracker.config.getboolean("options", "pager", True)
-    ):
+    def _lines():
+        row = "\t{id}  {start} to {stop}  {delta:>11}  {project}{tags}".format
+        for i, day in enumerate(sorted(frames_by_day, reverse=True)):
+            if i != 0:
+                yield ""
 
-        def _print(line):
-            lines.append(line)
+            frames = frames_by_day[day]
+            frames.sort(key=operator.attrgetter("start_ts"))
+            longest_project = max(len(frame.project) for frame in frames)
+            daily_total = sum(frame.stop_ts - frame.start_ts for frame in frames)
 
-        def _final_print(lines):
-            click.echo_via_pager("\n".join(lines))
-
-    else:
-
-        def _print(line):
-            click.echo(line)
-
-        def _final_print(lines):
-            pass
-
-    for i, (day, frames) in enumerate(frames_by_day):
-        if i != 0:
-            _print("")
-
-        frames = sorted(frames, key=operator.attrgetter("start"))
-        longest_project = max(len(frame.project) for frame in frames)
-
-        daily_total = reduce(
-            operator.add, (frame.stop - frame.start for frame in frames)
-        )
-
-        _print(
-            "{date} ({daily_total})".format(
-                date=style("date", "{:dddd DD MMMM YYYY}".format(day)),
-                daily_total=style("time", format_timedelta(daily_total)),
+            yield "{date} ({daily_total})".format(
+                date=style("date", "{:dddd DD MMMM YYYY}".format(frames[0].start)),
+                daily_total=style("time", format_seconds(daily_total)),
             )
-        )
 
-        _print(
-            "\n".join(
-                "\t{id}  {start} to {stop}  {delta:>11}  {project}{tags}".format(
-                    delta=format_timedelta(frame.stop - frame.start),
-                    project=style(
-                        "project", "{:>{}}".format(frame.project, longest_project)
-                    ),
-                    tags=(" " * 2 if frame.tags else "") + style("tags", frame.tags),
-                    start=style("time", "{:HH:mm}".format(frame.start)),
-                    stop=style("time", "{:HH:mm}".format(frame.stop)),
+            for frame in frames:
+                yield row(
+                    delta=format_seconds(frame.stop_ts - frame.start_ts),
+                    project=style("project", frame.project.rjust(longest_project)),
+                    tags="  " + style("tags", frame.tags) if frame.tags else "",
+                    # strftime skips arrow's format tokenizer, these are
+                    # formatted for every frame
+                    start=style("time", frame.start.strftime("%H:%M")),
+                    stop=style("time", frame.stop.strftime("%H:%M")),
                     id=style("short_id", frame.id),
                 )
-                for frame in frames
-            )
-        )
 
-    _final_print(lines)
+    # use the pager, or print directly to the terminal
+    _echo_lines(
+        _lines(),
+        pager
+        or (pager is None and timetracker.config.getboolean("options", "pager", True)),
+    )
 
 
 @cli.command(context_settings={"ignore_unknown_options": True})
@@ -828,6 +784,11 @@ def edit(timetracker, frame_id):
     variables (in that order) and defaults to `notepad` on Windows systems and
     to `vim`, `nano`, or `vi` (first one found) on all other systems.
     """
+    import arrow
+    from dateutil import tz
+
+    from ..frames import Frame
+
     if frame_id:
         frame = timetracker.frames(frame_id)
         frame_id = frame.id
@@ -863,6 +824,7 @@ def edit(timetracker, frame_id):
 
     start = None
     stop = None
+    is_started = timetracker.is_started
 
     # enter into while loop until succesful and validated
     #  edit has been performed
@@ -881,11 +843,12 @@ def edit(timetracker, frame_id):
             stop = parse_date(data["stop"]) if frame_id else None
             # if start time of the project is not before end time
             #  raise ValueException
-            if not timetracker.is_started and start > stop:
+            if not is_started and start > stop:
                 raise ValueError("Task cannot end before it starts.")
-            if start > arrow.now():
+            now = arrow.now()
+            if start > now:
                 raise ValueError("Start date can't be in the future")
-            if stop and stop > arrow.now():
+            if stop and stop > now:
                 raise ValueError("Stop date can't be in the future")
             # break out of while loop and continue execution of
             #  the edit function normally
@@ -926,19 +889,23 @@ def edit(timetracker, frame_id):
 @cli.command()
 @click.argument("key", required=False, metavar="SECTION.OPTION")
 @click.argument("value", required=False)
+@click.argument("assignments", nargs=-1, metavar="[SECTION.OPTION=VALUE]...")
 @click.option(
     "-e", "--edit", is_flag=True, help="Edit the configuration file with an editor."
 )
 @click.pass_obj
 @click.pass_context
 @catch_timetracker_error
-def config(ctx, timetracker, key, value, edit):
+def config(ctx, timetracker, key, value, assignments, edit):
     """
     Get and set configuration options.
 
     If `value` is not provided, the content of the `key` is displayed. Else,
     the given `value` is set.
 
+    Several options can be set at once with `section.option=value` pairs,
+    which saves the configuration file only once.
+
     You can edit the config file with an editor with the `--edit` option.
 
     Example:
@@ -947,12 +914,13 @@ def config(ctx, timetracker, key, value, edit):
     $ x config options.include_current true
     $ x config options.include_current
     true
+    $ x config options.pager=false options.stop_on_start=true
     """
     config = timetracker.config
 
     if edit:
         try:
-            with open(config.config_file) as fp:
+            with open(config.config_file, encoding="utf-8") as fp:
                 rawconfig = fp.read()
         except (IOError, OSError):
             rawconfig = ""
@@ -966,10 +934,26 @@ def config(ctx, timetracker, key, value, edit):
             click.echo(ctx.get_help())
             return
 
-        try:
-            section, option = key.split(".")
-        except ValueError:
-            raise click.ClickException("The key must have the format 'section.option'")
+        if "=" in key:
+            for assignment in (key, value) + assignments:
+                if assignment is None:
+                    continue
+                key, sep, value = assignment.partition("=")
+                if not sep:
+                    raise click.ClickException(
+                        "Options must be given as 'section.option=value' pairs"
+                    )
+                section, option = _config_key(key)
+                if not config.has_section(section):
+                    config.add_section(section)
+                config.set(section, option, value)
+            safe_save(config.config_file, config.write)
+            return
+
+        if assignments:
+            raise click.ClickException("Got unexpected extra arguments")
+
+        section, option = _config_key(key)
 
         if value is None:
             if not config.has_section(section):
@@ -987,3 +971,12 @@ def config(ctx, timetracker, key, value, edit):
 
             config.set(section, option, value)
             safe_save(config.config_file, config.write)
+
+
+def _config_key(key):
+    """Return the section and option of a 'section.option' key."""
+    try:
+        section, option = key.split(".")
+    except ValueError:
+        raise click.ClickException("The key must have the format 'section.option'")
+    return section, option
@@ -16,8 +16,7 @@ from .utils import (
     DateTime,
     catch_timetracker_error,
     style,
-    parse_project,
-    parse_tags,
+    parse_project_and_tags,
 )
 
 if TYPE_CHECKING:
@@ -65,20 +64,20 @@ def start(ctx, tt: TimeTracker, stretch, from_, restart, args):
     restart_flag = restart or tt.config.getboolean("options", "restart_on_start")
     stretch_flag = stretch or tt.config.getboolean("options", "autostretch_on_start")
 
-    project = parse_project(args)
-    tags = parse_tags(args)
+    project, tags = parse_project_and_tags(args)
+    running = tt.current
 
     # check that we can obtain a project to start
     if not project and not restart_flag:
         raise click.ClickException("No project given.")
 
     # check that we can stop the activity in progress (if any)
-    if tt.is_started and not stop_flag:
+    if running and not stop_flag:
         raise click.ClickException(
             style(
                 "error",
                 "Project {} is already started with tags '{}'".format(
-                    tt.current["project"], ", ".join(tt.current["tags"])
+                    running["project"], ", ".join(running["tags"])
                 ),
             )
         )
@@ -86,17 +85,17 @@ def start(ctx, tt: TimeTracker, stretch, from_, restart, args):
     # project is provided and restart is true
     if project and restart_flag:
         # obtain the tags from the last frame logged to the project
-        if tt.is_started and tt.current["project"] == project:
-            tags += tt.current["tags"]
+        if running and running["project"] == project:
+            tags += running["tags"]
         else:
             frame = tt.get_latest_frame(project)
             tags += frame["tags"] if frame else []
 
     # no project provided but we want to restart the latest active frame
     if not project and restart_flag:
-        if tt.is_started:
-            project = tt.current["project"]
-            tags += tt.current["tags"]
+        if running:
+            project = running["project"]
+            tags += running["tags"]
         else:
             frame = tt.frames(-1)
             if frame:
@@ -105,7 +104,7 @@ def start(ctx, tt: TimeTracker, stretch, from_, restart, args):
             else:
                 raise click.ClickException("No project to restart.")
 
-    if tt.is_started:
+    if running:
         ctx.invoke(stop)
 
     current = tt.start(project, tags, stretch_flag)
@@ -33,12 +33,11 @@ def status(tt: TimeTracker, project, tags, elapsed):
     The displayed date and time format can be configured with options
     `options.date_format` and `options.time_format`.
     """
-    if not tt.is_started:
+    current = tt.current
+    if not current:
         click.echo("No project started.")
         return
 
-    current = tt.current
-
     if project:
         click.echo(
             "{}".format(
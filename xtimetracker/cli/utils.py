@@ -4,25 +4,35 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 # SPDX-License-Identifier: MIT
 
+from __future__ import annotations
+
 import collections as co
-import csv
 import datetime
-import itertools
 import json
-import operator
 import os
-from dateutil import tz
-from functools import wraps
+import re
+from functools import lru_cache, wraps
 from io import StringIO
-from typing import List
+from typing import TYPE_CHECKING, List, Tuple
 
-import arrow
 import click
 from click.exceptions import UsageError
 
-from ..timetracker import TimeTrackerError, TimeTracker
+from ..utils import TimeTrackerError
+from .constants import SHORTCUT_OPTIONS
 from ..config import Config
 
+# arrow and the time tracker are only imported when a command needs them,
+# so that help and completion of command names don't pay for it
+if TYPE_CHECKING:
+    import arrow
+    from ..timetracker import TimeTracker
+
+# a time alone, HH:mm or HH:mm:ss
+_TIME_RE = re.compile(r"\s*(\d{2}):(\d{2})(?::(\d{2}))?\s*")
+# a date and time as written by format_date, YYYY-MM-DD HH:mm:ss
+_DATE_TIME_RE = re.compile(r"\s*(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\s*")
+
 
 class DateTimeParamType(click.ParamType):
     name = "datetime"
@@ -44,27 +54,53 @@ class DateTimeParamType(click.ParamType):
             return date
 
     def _parse_multiformat(self, value) -> arrow.Arrow:
-        date = None
-        for fmt in (None, "HH:mm:ss", "HH:mm"):
+        import arrow
+        from dateutil import tz
+
+        # Times alone have at most two digits before the first colon, anything
+        # else is parsed as an ISO-8601 string. Only one parser is tried.
+        if isinstance(value, str) and len(value.split(":", 1)[0].strip()) <= 2:
+            match = _TIME_RE.fullmatch(value)
+            if match is None:
+                return None
+            hour, minute, second = (int(group or 0) for group in match.groups())
+            # midnight at the end of the day is accepted as 24:00
+            if hour == 24 and minute == second == 0:
+                hour = 0
             try:
-                if fmt is None:
-                    # -> try to parse value as ISO-8601 string as local tz
-                    date = arrow.get(value, tzinfo=tz.tzlocal())
-                else:
-                    date = arrow.get(value, fmt)
-                    # -> arrow.now() returns the current time in local tz, then replace h:m:s
-                    date = arrow.now().replace(
-                        hour=date.hour, minute=date.minute, second=date.second
-                    )
-                break
-            except (ValueError, TypeError):
-                pass
-        return date
+                # -> arrow.now() returns the current time in local tz, then
+                # replace h:m:s
+                return arrow.now().replace(hour=hour, minute=minute, second=second)
+            except ValueError:
+                return None
+
+        try:
+            # -> try to parse value as ISO-8601 string as local tz
+            return arrow.get(value, tzinfo=tz.tzlocal())
+        except (ValueError, TypeError):
+            return None
 
 
 DateTime = DateTimeParamType()
 
 
+class PeriodParamType(DateTimeParamType):
+    """
+    Start date of one of the `SHORTCUT_OPTIONS` periods, given by name and
+    computed only when the option is used.
+    """
+
+    name = "period"
+
+    def convert(self, value, param, ctx):
+        if value in SHORTCUT_OPTIONS:
+            value = get_start_time_for_period(value)
+        return super().convert(value, param, ctx)
+
+
+Period = PeriodParamType()
+
+
 def catch_timetracker_error(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
@@ -77,6 +113,8 @@ def catch_timetracker_error(func):
 
 
 def create_timetracker(config: Config) -> TimeTracker:
+    from ..timetracker import TimeTracker
+
     return TimeTracker(config=config)
 
 
@@ -91,29 +129,41 @@ def create_configuration(contents=None, config_dir=None) -> Config:
     return c
 
 
-def style(name, element):
-    def _style_tags(tags):
-        if not tags:
-            return ""
+def _style_tags(tags):
+    if not tags:
+        return ""
+
+    return "[{}]".format(", ".join(style("tag", tag) for tag in tags))
+
+
+def _style_short_id(id):
+    return style("id", id[:7])
+
+
+_STYLES = {
+    "project": {"fg": "magenta"},
+    "tags": _style_tags,
+    "tag": {"fg": "blue"},
+    "time": {"fg": "green"},
+    "error": {"fg": "red"},
+    "date": {"fg": "cyan"},
+    "datetime": {"fg": "cyan"},
+    "short_id": _style_short_id,
+    "id": {"fg": "white"},
+}
 
-        return "[{}]".format(", ".join(style("tag", tag) for tag in tags))
 
-    def _style_short_id(id):
-        return style("id", id[:7])
+def style(name, element):
+    # the same projects, tags and ids are styled over and over, so results
+    # are cached (lists of tags are cached as tuples)
+    if isinstance(element, list):
+        element = tuple(element)
+    return _style(name, element)
 
-    formats = {
-        "project": {"fg": "magenta"},
-        "tags": _style_tags,
-        "tag": {"fg": "blue"},
-        "time": {"fg": "green"},
-        "error": {"fg": "red"},
-        "date": {"fg": "cyan"},
-        "datetime": {"fg": "cyan"},
-        "short_id": _style_short_id,
-        "id": {"fg": "white"},
-    }
 
-    fmt = formats.get(name, {})
+@lru_cache(maxsize=4096)
+def _style(name, element):
+    fmt = _STYLES.get(name, {})
 
     if isinstance(fmt, dict):
         return click.style(element, **fmt)
@@ -126,7 +176,15 @@ def format_timedelta(delta: datetime.timedelta):
     """
     Return a string roughly representing a timedelta.
     """
-    seconds = int(delta.total_seconds())
+    return format_seconds(delta.total_seconds())
+
+
+def format_seconds(seconds: float):
+    """
+    Return a string roughly representing a duration given in seconds.
+    """
+    # round to microseconds first, as a timedelta would do
+    seconds = int(round(seconds, 6))
     neg = seconds < 0
     seconds = abs(seconds)
     total = seconds
@@ -153,8 +211,19 @@ def format_date(date: arrow.Arrow) -> str:
 
 
 def parse_date(date: str) -> arrow.Arrow:
-    datetime_format = "YYYY-MM-DD HH:mm:ss"
-    return arrow.get(date, datetime_format, tzinfo=tz.tzlocal())
+    import arrow
+    from dateutil import tz
+
+    # strptime is much faster than arrow's parser, but also accepts fields
+    # with a single digit
+    match = _DATE_TIME_RE.fullmatch(date)
+    if match is None:
+        raise ValueError("Date '{}' is not in YYYY-MM-DD HH:mm:ss format".format(date))
+    datetime_format = "%Y-%m-%d %H:%M:%S"
+    return arrow.Arrow.fromdatetime(
+        datetime.datetime.strptime(match.group(1), datetime_format),
+        tzinfo=tz.tzlocal(),
+    )
 
 
 def options(opt_list):
@@ -177,6 +246,8 @@ def options(opt_list):
 
 
 def get_start_time_for_period(period):
+    import arrow
+
     # Using now() from datetime instead of arrow for mocking compatibility.
     now = arrow.Arrow.fromdatetime(datetime.datetime.now())
     date = now.date()
@@ -232,13 +303,20 @@ def apply_weekday_offset(start_time: arrow.Arrow, week_start: str) -> arrow.Arro
     return start_time.shift(days=offset)
 
 
+def _tags_index(values_list: List[str]) -> int:
+    """Return the index of the first tag (ie. value starting by '+')."""
+    return next(
+        (i for i, s in enumerate(values_list) if s[:1] == "+"), len(values_list)
+    )
+
+
 def parse_project(values_list: List[str]) -> str:
     """
     Return a string with the project name.
 
     Concatenate all values until one is a tag (ie. starts with '+').
     """
-    return " ".join(itertools.takewhile(lambda s: not s.startswith("+"), values_list))
+    return " ".join(values_list[: _tags_index(values_list)])
 
 
 def parse_tags(values_list: List[str]) -> List[str]:
@@ -248,27 +326,28 @@ def parse_tags(values_list: List[str]) -> List[str]:
     Find all the tags starting by a '+', even if there are spaces in them,
     then strip each tag and filter out the empty ones
     """
-    return list(
-        filter(
-            None,
-            map(
-                operator.methodcaller("strip"),
-                (
-                    # We concatenate the word with the '+' to the following words
-                    # not starting with a '+'
-                    w[1:]
-                    + " "
-                    + " ".join(
-                        itertools.takewhile(
-                            lambda s: not s.startswith("+"), values_list[i + 1 :]
-                        )
-                    )
-                    for i, w in enumerate(values_list)
-                    if w.startswith("+")
-                ),
-            ),
-        )
-    )  # pile of pancakes !
+    tags = []
+    words = None
+    for value in values_list:
+        if value[:1] == "+":
+            if words is not None:
+                tags.append(" ".join(words).strip())
+            words = [value[1:]]
+        elif words is not None:
+            # words not starting with a '+' belong to the previous tag
+            words.append(value)
+    if words is not None:
+        tags.append(" ".join(words).strip())
+    return [tag for tag in tags if tag]
+
+
+def parse_project_and_tags(values_list: List[str]) -> Tuple[str, List[str]]:
+    """
+    Return the project name and the list of tags from the input values list,
+    splitting it only once.
+    """
+    index = _tags_index(values_list)
+    return " ".join(values_list[:index]), parse_tags(values_list[index:])
 
 
 def frames_to_json(frames):
@@ -308,8 +387,9 @@ def frames_to_csv(frames):
         co.OrderedDict(
             [
                 ("id", frame.id[:7]),
-                ("start", frame.start.format("YYYY-MM-DD HH:mm:ss")),
-                ("stop", frame.stop.format("YYYY-MM-DD HH:mm:ss")),
+                # same as format("YYYY-MM-DD HH:mm:ss"), several times faster
+                ("start", frame.start.strftime("%Y-%m-%d %H:%M:%S")),
+                ("stop", frame.stop.strftime("%Y-%m-%d %H:%M:%S")),
                 ("project", frame.project),
                 ("tags", ", ".join(frame.tags)),
             ]
@@ -326,17 +406,28 @@ def build_csv(entries):
     The dictionary keys of the first item in the list are used as the header
     row for the built CSV. All item's keys are supposed to be identical.
     """
-    if entries:
-        header = entries[0].keys()
-    else:
-        return ""
+    return "".join(iter_csv(entries))
+
+
+def iter_csv(entries):
+    """
+    Yield the lines of the CSV built from an iterable of dict objects, as
+    `build_csv` does, without building the whole string. The header row is
+    yielded together with the first item.
+    """
+    import csv
+
     memfile = StringIO()
-    writer = csv.DictWriter(memfile, header, lineterminator=os.linesep)
-    writer.writeheader()
-    writer.writerows(entries)
-    output = memfile.getvalue()
+    writer = None
+    for entry in entries:
+        if writer is None:
+            writer = csv.DictWriter(memfile, entry.keys(), lineterminator=os.linesep)
+            writer.writeheader()
+        writer.writerow(entry)
+        yield memfile.getvalue()
+        memfile.seek(0)
+        memfile.truncate()
     memfile.close()
-    return output
 
 
 def flatten_report_for_csv(report):
@@ -400,6 +491,8 @@ def json_encoder(obj):
     :param obj: Object to encode
     :return: JSON representation of object
     """
+    import arrow
+
     if isinstance(obj, arrow.Arrow):
         return obj.for_json()
 
@@ -5,6 +5,7 @@
 # SPDX-License-Identifier: MIT
 
 """A convenience and compatibility wrapper for ConfigParser."""
+
 import os
 import shlex
 import configparser
@@ -22,6 +23,8 @@ class Config(configparser.ConfigParser):
     def __init__(self, config_dir=None, **kwargs):
         self.config_dir = config_dir
         self.config_file = os.path.join(self.config_dir, "config")
+        # converted option values, cleared whenever the configuration changes
+        self._cache = {}
         super().__init__(**kwargs)
 
     def reload(self, contents=None):
@@ -35,17 +38,34 @@ class Config(configparser.ConfigParser):
             if contents is not None:
                 self.read_string(contents)
             else:
-                self.read(self.config_file)
+                self.read(self.config_file, encoding="utf-8")
         except configparser.Error as e:
             raise ConfigurationError("Cannot parse config: {}".format(e))
 
+    def _cached(self, kind, section, option, convert):
+        """
+        Return the converted value of option in given section, or None if
+        the option is not set. Conversions are done once per option and kind.
+        """
+        key = (kind, section, option)
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        val = super().get(section, option, fallback=None)
+        value = self._cache[key] = None if val is None else convert(val)
+        return value
+
     def get(self, section, option, default=None, **kwargs):
         """
         Return value of option in given configuration section as a string.
 
         If option is not set, return default instead (defaults to None).
         """
-        return super().get(section, option, fallback=default, **kwargs)
+        if kwargs:
+            return super().get(section, option, fallback=default, **kwargs)
+        val = self._cached("str", section, option, str)
+        return default if val is None else val
 
     def getint(self, section, option, default=None):
         """
@@ -55,8 +75,8 @@ class Config(configparser.ConfigParser):
 
         Raises ValueError if the value cannot be converted to an integer.
         """
-        val = self.get(section, option)
-        return default if val is None else int(val)
+        val = self._cached("int", section, option, int)
+        return default if val is None else val
 
     def getfloat(self, section, option, default=None):
         """
@@ -67,8 +87,8 @@ class Config(configparser.ConfigParser):
         Raises ValueError if the value cannot be converted to a float.
 
         """
-        val = self.get(section, option)
-        return default if val is None else float(val)
+        val = self._cached("float", section, option, float)
+        return default if val is None else val
 
     def getboolean(self, section, option, default=False):
         """
@@ -80,8 +100,8 @@ class Config(configparser.ConfigParser):
 
         If option is not set or empty, return default (defaults to False).
         """
-        val = self.get(section, option)
-        return val.lower() in ("1", "on", "true", "yes") if val else default
+        val = self._cached("bool", section, option, _to_boolean)
+        return default if val is None else val
 
     def getlist(self, section, option, default=None):
         """
@@ -108,15 +128,10 @@ class Config(configparser.ConfigParser):
                 five six
             option1 = one  "two three" four 'five  six'
         """
-        if not self.has_option(section, option):
+        val = self._cached("list", section, option, _to_list)
+        if val is None:
             return [] if default is None else default
-
-        value = self.get(section, option)
-
-        if "\n" in value:
-            return [item.strip() for item in value.splitlines() if item.strip()]
-        else:
-            return shlex.split(value)
+        return list(val)
 
     def set(self, section, option, value):
         """
@@ -128,3 +143,32 @@ class Config(configparser.ConfigParser):
             self.add_section(section)
 
         super().set(section, option, value)
+        self._cache.clear()
+
+    def _read(self, fp, fpname):
+        # read, read_string and read_file all end up here, even if the file
+        # cannot be parsed some options may have been read
+        try:
+            return super()._read(fp, fpname)
+        finally:
+            self._cache.clear()
+
+    def remove_option(self, section, option):
+        self._cache.clear()
+        return super().remove_option(section, option)
+
+    def remove_section(self, section):
+        self._cache.clear()
+        return super().remove_section(section)
+
+
+def _to_boolean(value):
+    # an empty value is handled as not set
+    return value.lower() in ("1", "on", "true", "yes") if value else None
+
+
+def _to_list(value):
+    if "\n" in value:
+        return [item.strip() for item in value.splitlines() if item.strip()]
+    else:
+        return shlex.split(value)
@@ -4,13 +4,17 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 # SPDX-License-Identifier: MIT
 
-import shutil
-import tempfile
 import os
 import json
 
 from .utils import TimeTrackerError
 
+try:
+    # optional, parses the frames file several times faster than json
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
 
 class FileIOError(TimeTrackerError):
     pass
@@ -25,20 +29,40 @@ def safe_save(path, content, ext=".bak"):
     function may write (unicode) strings to the file object (but doesn't need
     to close it).
 
-    The file to write to is created at a temporary location first. If there is
-    an error creating or writing to the temp file or calling `content`, the
-    destination file is left untouched. Otherwise, if all is well, an existing
-    destination file is backed up to `path` + `ext` (defaults to '.bak') and
-    the temporary file moved into its place.
+    The file to write to is created at a temporary location in the destination
+    directory first. If there is an error creating or writing to the temp file
+    or calling `content`, the destination file is left untouched. Otherwise, if
+    all is well, the temp file is flushed to disk, an existing destination file
+    is backed up to `path` + `ext` (defaults to '.bak') and the temporary file
+    renamed into its place, so that `path` always exists.
 
     """
-    tmpfp = tempfile.NamedTemporaryFile(mode="w+", delete=False)
+    dirname = os.path.dirname(path)
+    try:
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+    except (IOError, OSError) as e:
+        raise FileIOError("Error creating directory '{}': {}".format(dirname, e))
+
+    # only commands that write need tempfile, don't import it on startup
+    import tempfile
+
+    tmpfp = tempfile.NamedTemporaryFile(
+        mode="w+",
+        encoding="utf-8",
+        dir=dirname,
+        prefix=os.path.basename(path) + ".",
+        suffix=".tmp",
+        delete=False,
+    )
     try:
         with tmpfp as fp:
             if isinstance(content, str):
                 fp.write(content)
             else:
                 content(fp)
+            fp.flush()
+            os.fsync(fp.fileno())
     except Exception as e:
         try:
             os.unlink(tmpfp.name)
@@ -46,21 +70,42 @@ def safe_save(path, content, ext=".bak"):
             pass
         raise FileIOError("Error writing file '{}': {}".format(tmpfp.name, e))
     else:
-        dirname = os.path.dirname(path)
-        try:
-            if not os.path.exists(dirname):
-                os.makedirs(dirname)
-        except (IOError, OSError) as e:
-            raise FileIOError("Error creating directory '{}': {}".format(dirname, e))
-
         if os.path.exists(path):
-            try:
-                os.unlink(path + ext)
-            except OSError:
-                pass
-            shutil.move(path, path + ext)
+            _backup(path, path + ext)
 
-        shutil.move(tmpfp.name, path)
+        os.replace(tmpfp.name, path)
+        _fsync_dir(dirname)
+
+
+def _backup(path, backup):
+    """Keep the current contents of path at backup, leaving path in place."""
+    try:
+        os.remove(backup)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(path, backup)
+    except OSError:
+        # e.g. the filesystem doesn't support hard links
+        import shutil
+
+        shutil.copy2(path, backup)
+
+
+def _fsync_dir(dirname):
+    """Make the renames in the given directory durable (POSIX only)."""
+    if os.name != "posix":
+        return
+    try:
+        fd = os.open(dirname, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
 
 
 def load_json(filename, type=dict):
@@ -70,7 +115,10 @@ def load_json(filename, type=dict):
     given type.
     """
     try:
-        with open(filename) as f:
+        if orjson is not None:
+            with open(filename, "rb") as f:
+                return orjson.loads(f.read())
+        with open(filename, encoding="utf-8") as f:
             return json.load(f)
     except FileNotFoundError:
         return type()
@@ -99,3 +147,89 @@ def json_writer(func, *args, **kwargs):
         f.write(dump)
 
     return writer
+
+
+def json_list_writer(func, *args, **kwargs):
+    """
+    Return a function that receives a file-like object and writes the items
+    of the iterable returned by func(*args, **kwargs) as a JSON list, one item
+    per line, without building the whole document in memory.
+    """
+
+    def writer(f):
+        encode = json.JSONEncoder(ensure_ascii=False).encode
+        separator = "[\n"
+        for item in func(*args, **kwargs):
+            f.write(separator)
+            f.write(encode(item))
+            separator = ",\n"
+        f.write("[]" if separator == "[\n" else "\n]")
+
+    return writer
+
+
+def _drop_unterminated_line(f):
+    """
+    Truncate the given binary file after its last newline, dropping a last
+    line cut short (e.g. by a crash while appending to it).
+    """
+    end = pos = f.seek(0, os.SEEK_END)
+    while pos > 0:
+        start = max(0, pos - 4096)
+        f.seek(start)
+        chunk = f.read(pos - start)
+        if pos == end and chunk.endswith(b"\n"):
+            return
+        newline = chunk.rfind(b"\n")
+        if newline >= 0:
+            f.truncate(start + newline + 1)
+            return
+        pos = start
+    f.truncate(0)
+
+
+def append_json_lines(path, items, truncate=False):
+    """
+    Append each of the given items to the file at the given path, as one JSON
+    document per line, and flush the file to disk. If truncate is True, the
+    previous contents of the file are discarded, otherwise a last line cut
+    short is.
+    """
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    with open(path, "wb" if truncate else "ab+") as f:
+        if not truncate:
+            _drop_unterminated_line(f)
+        for item in items:
+            f.write((encode(item) + "\n").encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def load_json_lines(filename):
+    """
+    Return the items of the given file holding one JSON document per line,
+    and whether its last line was cut short (e.g. by a crash while appending
+    to it), in which case that line is ignored. A line is only complete once
+    its newline is written, even if it already holds a valid document.
+    If the file doesn't exist, return an empty list.
+    """
+    try:
+        with open(filename, encoding="utf-8") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return [], False
+    except Exception as e:
+        raise TimeTrackerError(
+            "Unexpected error while loading JSON file {}: {}".format(filename, e)
+        )
+
+    truncated = bool(lines) and not lines[-1].endswith("\n")
+    if truncated:
+        lines.pop()
+    items = []
+    for line in lines:
+        try:
+            items.append(json.loads(line))
+        except ValueError as e:
+            raise TimeTrackerError("Invalid JSON file {}: {}".format(filename, e))
+    return items, truncated
@@ -4,73 +4,144 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 # SPDX-License-Identifier: MIT
 
+import bisect
+import sys
 import uuid
 from copy import copy
+from functools import lru_cache
 
 import arrow
+from dateutil import tz
 
 from .utils import TimeTrackerError
 
+HEADERS = ("start", "stop", "project", "id", "tags", "updated_at")
+
+# arrow's .to("local") parses the name and creates a tzlocal() every time
+_LOCAL_TZ = tz.tzlocal()
+
+
+@lru_cache(maxsize=4096)
+def _local(timestamp):
+    """
+    Return the given POSIX timestamp as an Arrow object in local time.
+
+    Frame objects are built every time a row is read, so the same dates are
+    converted again and again; Arrow objects are immutable and can be shared.
+    """
+    return arrow.Arrow.fromtimestamp(timestamp, tzinfo=_LOCAL_TZ)
+
+
+def _timestamp(value):
+    """
+    Return the POSIX timestamp of a date given as a number, an Arrow object or
+    anything else `arrow.get()` understands.
+    """
+    if isinstance(value, (int, float)):
+        return value
+    if not isinstance(value, arrow.Arrow):
+        value = arrow.get(value)
+    return value.float_timestamp
+
 
 class Frame:
-    __slots__ = ("start", "stop", "project", "id", "tags", "updated_at")
+    """
+    Dates are stored as POSIX timestamps and only converted to (local) Arrow
+    objects the first time they are accessed.
+    """
+
+    __slots__ = (
+        "start_ts",
+        "stop_ts",
+        "project",
+        "id",
+        "tags",
+        "updated_at_ts",
+        "_start",
+        "_stop",
+        "_updated_at",
+    )
 
     def __init__(self, start, stop, project, id, tags=None, updated_at=None):
         try:
-            if not isinstance(start, arrow.Arrow):
-                start = arrow.get(start)
-
-            if not isinstance(stop, arrow.Arrow):
-                stop = arrow.get(stop)
-
-            if updated_at is None:
-                self.updated_at = arrow.now()
-            elif not isinstance(updated_at, arrow.Arrow):
-                self.updated_at = arrow.get(updated_at)
+            self.start = start
+            self.stop = stop
+            self.updated_at = arrow.now() if updated_at is None else updated_at
         except (ValueError, TypeError) as e:
             raise TimeTrackerError("Error converting date: {}".format(e))
 
-        self.start = start.to("local")
-        self.stop = stop.to("local")
         self.project = project
         self.id = id
         self.tags = [] if tags is None else tags
 
+    @property
+    def start(self):
+        if self._start is None:
+            self._start = _local(self.start_ts)
+        return self._start
+
+    @start.setter
+    def start(self, value):
+        self.start_ts = _timestamp(value)
+        self._start = None
+
+    @property
+    def stop(self):
+        if self._stop is None:
+            self._stop = _local(self.stop_ts)
+        return self._stop
+
+    @stop.setter
+    def stop(self, value):
+        self.stop_ts = _timestamp(value)
+        self._stop = None
+
+    @property
+    def updated_at(self):
+        if self._updated_at is None:
+            self._updated_at = _local(self.updated_at_ts)
+        return self._updated_at
+
+    @updated_at.setter
+    def updated_at(self, value):
+        self.updated_at_ts = _timestamp(value)
+        self._updated_at = None
+
     def dump(self):
-        start = self.start.timestamp
-        stop = self.stop.timestamp
-        updated_at = self.updated_at.timestamp
+        start = int(self.start_ts)
+        stop = int(self.stop_ts)
+        updated_at = int(self.updated_at_ts)
 
         return (start, stop, self.project, self.id, self.tags, updated_at)
 
     def copy(self, start=None, stop=None) -> "Frame":
-        start = copy(self.start) if start is None else start
-        stop = copy(self.stop) if stop is None else stop
+        start = self.start_ts if start is None else start
+        stop = self.stop_ts if stop is None else stop
         tags = copy(self.tags) if self.tags is not None else []
-        return Frame(start, stop, self.project, self.id, tags, self.updated_at)
+        return Frame(start, stop, self.project, self.id, tags, self.updated_at_ts)
 
     def __getitem__(self, key):
         # allow access by key as if this was a dictionary
-        if key in self.__slots__:
+        if key in HEADERS:
             return getattr(self, key)
 
         # allow sequencial access
         try:
-            return getattr(self, self.__slots__[key])
+            return getattr(self, HEADERS[key])
         except KeyError:
             raise IndexError
 
     def __lt__(self, other):
-        return self.start < other.start
+        return self.start_ts < other.start_ts
 
     def __lte__(self, other):
-        return self.start <= other.start
+        return self.start_ts <= other.start_ts
 
     def __gt__(self, other):
-        return self.start > other.start
+        return self.start_ts > other.start_ts
 
     def __gte__(self, other):
-        return self.start >= other.start
+        return self.start_ts >= other.start_ts
 
 
 class Span:
@@ -78,46 +149,81 @@ class Span:
         self.timeframe = timeframe
         self.start = start.floor(self.timeframe)
         self.stop = stop.ceil(self.timeframe)
+        self.start_ts = self.start.float_timestamp
+        self.stop_ts = self.stop.float_timestamp
 
     def overlaps(self, frame: Frame) -> bool:
-        return frame.start <= self.stop and frame.stop >= self.start
+        return frame.start_ts <= self.stop_ts and frame.stop_ts >= self.start_ts
 
     def __or__(self, other: "Span") -> "Span":
-        new_span = Span(self.start, self.stop, self.timeframe)
-        if other.start < self.start:
-            new_span.start = other.start.floor(self.timeframe)
-        if other.stop > self.stop:
-            new_span.stop = other.stop.ceil(self.timeframe)
-        return new_span
+        start = other.start if other.start_ts < self.start_ts else self.start
+        stop = other.stop if other.stop_ts > self.stop_ts else self.stop
+        return Span(start, stop, self.timeframe)
 
     def __contains__(self, frame: Frame) -> bool:
-        return frame.start >= self.start and frame.stop <= self.stop
+        return frame.start_ts >= self.start_ts and frame.stop_ts <= self.stop_ts
 
 
 class Frames:
+    """
+    Frames are stored by columns (one list per frame attribute) and a `Frame`
+    object is only built when a row is requested. Returned frames don't share
+    any value with the stored ones, changing them doesn't change the frames.
+    """
+
     def __init__(self, frames=None):
         if not frames:
             frames = []
-        self._rows = []
-        min_start, max_stop = arrow.now(), arrow.get(0)
+        self._starts = []
+        self._stops = []
+        self._projects = []
+        self._ids = []
+        self._tags = []
+        self._updated = []
+        # id -> row index, built on the first lookup by id
+        self._id_index = None
+        # (id, row index) pairs sorted by id, built on the first lookup by prefix
+        self._sorted_ids = None
+        # rows sorted by start time, built on the first filter by span
+        self._start_index = None
+        now = arrow.now().float_timestamp
         for frame in frames:
-            f = Frame(*frame)
-            min_start = min(min_start, f.start)
-            max_stop = max(max_stop, f.stop)
-            self._rows.append(f)
-        self.span = Span(min_start, max_stop)
+            if isinstance(frame, Frame):
+                self._append(frame)
+            else:
+                self._load_row(now, *frame)
+        # computed on first use, most commands never need it
+        self._span = None
         self.changed = False
+        # rows [0, _saved) are stored; _rewritten if one of them was modified
+        self._saved = len(self._ids)
+        self._rewritten = False
+
+    @property
+    def span(self):
+        if self._span is None:
+            min_start = min(self._starts, default=arrow.now().float_timestamp)
+            max_stop = max(self._stops, default=0)
+            self._span = Span(_local(min_start), _local(max_stop))
+        return self._span
 
     def __len__(self):
-        return len(self._rows)
+        return len(self._ids)
+
+    def __iter__(self):
+        return (self._row(i) for i in range(len(self._ids)))
 
     def __getitem__(self, key):
         if isinstance(key, int):
-            return self._rows[key]
-        try:
-            return tuple(getattr(row, key) for row in self._rows)
-        except AttributeError:
-            return self._rows[self._get_index_by_id(key)]
+            return self._row(key)
+        if key in HEADERS:
+            column = self._columns()[HEADERS.index(key)]
+            if key in ("start", "stop", "updated_at"):
+                return tuple(_local(ts) for ts in column)
+            if key == "tags":
+                return tuple(list(tags) for tags in column)
+            return tuple(column)
+        return self._row(self._get_index_by_id(key))
 
     def __setitem__(self, key, value):
         self.changed = True
@@ -128,38 +234,154 @@ class Frames:
             frame = self.new_frame(*value)
 
         if isinstance(key, int):
-            self._rows[key] = frame
+            self._set_row(key, frame)
         else:
             frame.id = key
             try:
-                self._rows[self._get_index_by_id(key)] = frame
+                self._set_row(self._get_index_by_id(key), frame)
             except KeyError:
-                self._rows.append(frame)
+                self._append(frame)
 
     def __delitem__(self, key):
         self.changed = True
 
-        if isinstance(key, int):
-            del self._rows[key]
-        else:
-            del self._rows[self._get_index_by_id(key)]
+        if not isinstance(key, int):
+            key = self._get_index_by_id(key)
+        for column in self._columns():
+            del column[key]
+        self._rewritten = True
+        # every row after the deleted one has moved
+        self._id_index = None
+        self._sorted_ids = None
+        self._start_index = None
+
+    def _columns(self):
+        return (
+            self._starts,
+            self._stops,
+            self._projects,
+            self._ids,
+            self._tags,
+            self._updated,
+        )
+
+    def _row(self, index):
+        return Frame(
+            self._starts[index],
+            self._stops[index],
+            self._projects[index],
+            self._ids[index],
+            list(self._tags[index]),
+            self._updated[index],
+        )
+
+    def _values(self, frame):
+        return (
+            frame.start_ts,
+            frame.stop_ts,
+            sys.intern(frame.project),
+            frame.id,
+            [sys.intern(tag) for tag in frame.tags],
+            frame.updated_at_ts,
+        )
+
+    def _load_row(self, now, start, stop, project, id, tags=None, updated_at=None):
+        try:
+            start = _timestamp(start)
+            stop = _timestamp(stop)
+            updated_at = now if updated_at is None else _timestamp(updated_at)
+        except (ValueError, TypeError) as e:
+            raise TimeTrackerError("Error converting date: {}".format(e))
+
+        # projects and tags repeat across many frames: keep a single copy
+        self._starts.append(start)
+        self._stops.append(stop)
+        self._projects.append(sys.intern(project))
+        self._ids.append(id)
+        self._tags.append([] if tags is None else [sys.intern(tag) for tag in tags])
+        self._updated.append(updated_at)
+
+    def _append(self, frame):
+        for column, value in zip(self._columns(), self._values(frame)):
+            column.append(value)
+        if self._id_index is not None:
+            self._id_index.setdefault(frame.id, len(self._ids) - 1)
+        if self._sorted_ids is not None:
+            bisect.insort(self._sorted_ids, (frame.id, len(self._ids) - 1))
+        if self._start_index is not None:
+            order, starts, longest = self._start_index
+            position = bisect.bisect_right(starts, frame.start_ts)
+            starts.insert(position, frame.start_ts)
+            order.insert(position, len(self._ids) - 1)
+            longest = max(longest, frame.stop_ts - frame.start_ts)
+            self._start_index = (order, starts, longest)
+
+    def _set_row(self, index, frame):
+        self._rewritten = True
+        if self._ids[index] != frame.id:
+            self._id_index = None
+            self._sorted_ids = None
+        self._start_index = None
+        for column, value in zip(self._columns(), self._values(frame)):
+            column[index] = value
+
+    def _rows_in_span(self, span):
+        """
+        Return, in insertion order, the index of the rows that may overlap the
+        given span: those starting before its end and no earlier than its start
+        minus the duration of the longest frame.
+        """
+        if self._start_index is None:
+            order = sorted(range(len(self._starts)), key=self._starts.__getitem__)
+            starts = [self._starts[i] for i in order]
+            longest = max(
+                (stop - start for start, stop in zip(self._starts, self._stops)),
+                default=0,
+            )
+            self._start_index = (order, starts, longest)
+
+        order, starts, longest = self._start_index
+        lo = bisect.bisect_left(starts, span.start_ts - longest)
+        hi = bisect.bisect_right(starts, span.stop_ts)
+        return sorted(order[lo:hi])
 
     def _get_index_by_id(self, id):
+        if self._id_index is None:
+            self._id_index = {}
+            for i, v in enumerate(self._ids):
+                self._id_index.setdefault(v, i)
         try:
-            return next(i for i, v in enumerate(self["id"]) if v.startswith(id))
-        except StopIteration:
+            return self._id_index[id]
+        except KeyError:
+            pass
+        # not a full id: the ids starting by it are contiguous once sorted,
+        # return the first one that was added
+        if self._sorted_ids is None:
+            self._sorted_ids = sorted((v, i) for i, v in enumerate(self._ids))
+        sorted_ids = self._sorted_ids
+        position = bisect.bisect_left(sorted_ids, (id,))
+        index = None
+        while position < len(sorted_ids) and sorted_ids[position][0].startswith(id):
+            row = sorted_ids[position][1]
+            if index is None or row < index:
+                index = row
+            position += 1
+        if index is None:
             raise KeyError("Frame with id {} not found.".format(id))
+        return index
 
-    def _update_span(self, start, stop):
-        min_start = min(start, self.span.start)
-        max_stop = max(stop, self.span.stop)
-        self.span = Span(min_start, max_stop)
+    def _update_span(self, frame):
+        if self._span is None:
+            # the new frame is already in the columns the span is built from
+            return
+        if frame.start_ts < self._span.start_ts or frame.stop_ts > self._span.stop_ts:
+            self._span |= Span(frame.start, frame.stop)
 
     def add(self, *args, **kwargs):
         self.changed = True
         frame = self.new_frame(*args, **kwargs)
-        self._rows.append(frame)
-        self._update_span(frame.start, frame.stop)
+        self._append(frame)
+        self._update_span(frame)
         return frame
 
     def new_frame(self, project, start, stop, tags=None, id=None, updated_at=None):
@@ -167,8 +389,41 @@ class Frames:
             id = uuid.uuid4().hex
         return Frame(start, stop, project, id, tags=tags, updated_at=updated_at)
 
+    def last_stopped(self):
+        """Return the frame with the latest stop date, or None if empty."""
+        if not self._stops:
+            return None
+        return self._row(max(range(len(self._stops)), key=self._stops.__getitem__))
+
+    def ids(self):
+        """Return an iterator over the frame ids, without building frames."""
+        return iter(self._ids)
+
     def dump(self):
-        return tuple(frame.dump() for frame in self._rows)
+        return tuple(self.iter_dump())
+
+    def unsaved_rows(self):
+        """
+        Return the dump of the frames added since they were loaded or last
+        saved, or None if a saved frame was modified or removed since then.
+        """
+        if self._rewritten:
+            return None
+        return list(self.iter_dump(self._saved))
+
+    def mark_saved(self):
+        """Record that all the frames are now stored."""
+        self._saved = len(self._ids)
+        self._rewritten = False
+
+    def iter_dump(self, first=0):
+        columns = self._columns()
+        if first:
+            columns = tuple(column[first:] for column in columns)
+        return (
+            (int(start), int(stop), project, id, tags, int(updated_at))
+            for start, stop, project, id, tags, updated_at in zip(*columns)
+        )
 
     def filter(
         self,
@@ -178,26 +433,40 @@ class Frames:
         ignore_tags=None,
         span=None,
     ):
-
-        for frame in self._rows:
-            if projects and frame.project not in projects:
+        projects = frozenset(projects) if projects else None
+        tags = frozenset(tags) if tags else None
+        ignore_projects = frozenset(ignore_projects) if ignore_projects else None
+        ignore_tags = frozenset(ignore_tags) if ignore_tags else None
+
+        # the criteria are checked on the columns, a Frame is only built for
+        # the rows that are returned
+        rows = self._rows_in_span(span) if span else range(len(self._ids))
+        for i in rows:
+            start = self._starts[i]
+            stop = self._stops[i]
+            project = self._projects[i]
+            frame_tags = self._tags[i]
+
+            if projects and project not in projects:
                 continue
-            if ignore_projects and frame.project in ignore_projects:
+            if ignore_projects and project in ignore_projects:
                 continue
 
-            if tags and not any(tag in frame.tags for tag in tags):
+            if tags and tags.isdisjoint(frame_tags):
                 continue
-            if ignore_tags and any(tag in frame.tags for tag in ignore_tags):
+            if ignore_tags and not ignore_tags.isdisjoint(frame_tags):
                 continue
 
             if not span:
-                yield frame
-            elif frame in span:
-                yield frame
-            elif span.overlaps(frame):
+                yield self._row(i)
+            elif start >= span.start_ts and stop <= span.stop_ts:
+                yield self._row(i)
+            elif start <= span.stop_ts and stop >= span.start_ts:
                 # If requested, return the part of the frame that is within the
                 # span, for frames that are *partially* within span or reaching
                 # over span
-                start = span.start if frame.start < span.start else frame.start
-                stop = span.stop if frame.stop > span.stop else frame.stop
-                yield frame.copy(start=start, stop=stop)
+                # the row is already detached from the stored frame
+                frame = self._row(i)
+                frame.start = max(start, span.start_ts)
+                frame.stop = min(stop, span.stop_ts)
+                yield frame
@@ -4,17 +4,18 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 # SPDX-License-Identifier: MIT
 
+import bisect
 import datetime
-import operator
+import itertools
+import uuid
 import arrow
 from collections import defaultdict
-from functools import reduce
 from typing import List, Optional, Union
 
 from .backend import Backend
 from .config import Config
-from .utils import deduplicate, sorted_groupby, TimeTrackerError
-from .frames import Frames, Span
+from .utils import deduplicate, TimeTrackerError
+from .frames import Frame, Frames, Span
 
 
 class TimeTracker:
@@ -26,10 +27,33 @@ class TimeTracker:
         self.config = config
         self._current: Optional[dict] = None
         self._backend = Backend(config.config_dir)
-        self._frames: Frames = self._backend.load_frames()
+        self._loaded_frames: Optional[Frames] = None
+        # frames stopped before the frames were loaded, see stop()
+        self._stopped_frames: List[Frame] = []
+        # projects() and tags() results, cleared whenever frames change
+        self._names_cache: dict = {}
 
     def save(self):
-        self._backend.save(self._current, self._frames)
+        self._backend.save(self._current, self._loaded_frames)
+        if self._stopped_frames:
+            self._backend.append_frames(self._stopped_frames)
+            self._stopped_frames = []
+
+    @property
+    def _frames(self) -> Frames:
+        if self._loaded_frames is None:
+            self._loaded_frames = self._backend.load_frames()
+            for frame in self._stopped_frames:
+                self._loaded_frames.add(
+                    frame.project,
+                    frame.start_ts,
+                    frame.stop_ts,
+                    tags=frame.tags,
+                    id=frame.id,
+                    updated_at=frame.updated_at_ts,
+                )
+            self._stopped_frames = []
+        return self._loaded_frames
 
     @property
     def current(self):
@@ -64,6 +88,10 @@ class TimeTracker:
 
         return self._frames.filter(**filters)
 
+    def frame_ids(self):
+        """Returns the ids of all the frames, in the order they were added."""
+        return self._frames.ids()
+
     def count(self):
         return len(self._frames)
 
@@ -74,7 +102,7 @@ class TimeTracker:
         for f in self.frames(projects=[project]):
             if not last_frame:
                 last_frame = f
-            elif last_frame.start < f.start:
+            elif last_frame.start_ts < f.start_ts:
                 last_frame = f
         return last_frame
 
@@ -100,6 +128,7 @@ class TimeTracker:
         tags = (tags or []) + default_tags
 
         frame = self._frames.add(project, from_date, to_date, tags=tags)
+        self._names_cache.clear()
         return frame
 
     def edit(
@@ -112,35 +141,53 @@ class TimeTracker:
     ):
         if frame_id:
             self._frames[frame_id] = (project, start, stop, tags)
+            self._names_cache.clear()
         else:
             self._current = dict(start=start, project=project, tags=tags)
 
     def start(self, project, tags=None, stretch=False):
         assert not self.is_started
         default_tags = self.config.getlist("default_tags", project)
-        tags = (tags or []) + default_tags
-        new_frame = {"project": project, "tags": deduplicate(tags)}
-        if stretch and len(self._frames) > 0:
+        new_frame = {"project": project, "tags": deduplicate(tags or (), default_tags)}
+        now = arrow.now()
+        last_frame = self._frames.last_stopped() if stretch else None
+        if last_frame is not None:
             max_elapsed = self.config.getint(
                 "options", "autostretch_max_elapsed_secs", 28800
             )
-            last_frame = max(self._frames, key=lambda f: f.stop.timestamp)
-            if arrow.now().timestamp - last_frame.stop.timestamp < max_elapsed:
+            if now.float_timestamp - last_frame.stop_ts < max_elapsed:
                 new_frame["start"] = last_frame.stop
         if "start" not in new_frame:
-            new_frame["start"] = arrow.now()
+            new_frame["start"] = now
         self._current = new_frame
         return self._current
 
     def stop(self):
         if not self.is_started:
             raise TimeTrackerError("No project started.")
-        frame = self._frames.add(
-            self._current["project"],
-            self._current["start"],
-            arrow.now(),
-            tags=self._current["tags"],
-        )
+        # the frame stops and is updated at the same time
+        now = arrow.now()
+        if self._loaded_frames is None:
+            # stopping doesn't need the existing frames, the new one is
+            # appended to them on save without loading them
+            frame = Frame(
+                self._current["start"],
+                now,
+                self._current["project"],
+                uuid.uuid4().hex,
+                tags=self._current["tags"],
+                updated_at=now,
+            )
+            self._stopped_frames.append(frame)
+        else:
+            frame = self._frames.add(
+                self._current["project"],
+                self._current["start"],
+                now,
+                tags=self._current["tags"],
+                updated_at=now,
+            )
+        self._names_cache.clear()
         self._current = None
         return frame
 
@@ -155,38 +202,48 @@ class TimeTracker:
         """
         Return the list of all the existing projects, sorted by name.
         """
-        frames = self.frames(tags=tags)
+        key = ("projects", tuple(tags or ()))
+        if key not in self._names_cache:
+            self._names_cache[key] = self._projects(tags)
+        return list(self._names_cache[key])
+
+    def _projects(self, tags):
+        if not tags:
+            return sorted(set(self._frames["project"]))
+
+        tags = set(tags)
         matched_tags = defaultdict(set)
         projects = set()
-        for f in frames:
-            for t in f.tags:
+        for f in self.frames(tags=tags):
+            for t in tags.intersection(f.tags):
                 matched_tags[t].add(f.project)
             projects.add(f.project)
-        return sorted(
-            p for p in projects if not tags or all(p in matched_tags[t] for t in tags)
-        )
+        return sorted(p for p in projects if all(p in matched_tags[t] for t in tags))
 
     def tags(self, projects=None):
         """
         Return the list of the tags, sorted by name.
         """
-        frames = self.frames(projects=projects)
+        key = ("tags", tuple(projects or ()))
+        if key not in self._names_cache:
+            self._names_cache[key] = self._tags(projects)
+        return list(self._names_cache[key])
+
+    def _tags(self, projects):
+        if not projects:
+            return sorted(set(t for tags in self._frames["tags"] for t in tags))
+
         matched_projects = defaultdict(set)
         tags = set()
-        for f in frames:
-            for t in f.tags:
-                matched_projects[f.project].add(t)
-                tags.add(t)
+        for f in self.frames(projects=projects):
+            matched_projects[f.project].update(f.tags)
+            tags.update(f.tags)
         return sorted(
-            t
-            for t in tags
-            if not projects or all(t in matched_projects[p] for p in projects)
+            t for t in tags if all(t in matched_projects[p] for p in projects)
         )
 
     def _validate_inclusion_options(self, included, excluded):
-        return not bool(
-            included and excluded and set(included).intersection(set(excluded))
-        )
+        return not (included and excluded) or set(included).isdisjoint(excluded)
 
     def log(
         self,
@@ -203,6 +260,37 @@ class TimeTracker:
         day=None,
         full=None,
     ):
+        return self._log(
+            from_,
+            to,
+            current=current,
+            projects=projects,
+            tags=tags,
+            ignore_projects=ignore_projects,
+            ignore_tags=ignore_tags,
+            year=year,
+            month=month,
+            week=week,
+            day=day,
+            full=full,
+        )[0]
+
+    def _log(
+        self,
+        from_,
+        to,
+        current=None,
+        projects=None,
+        tags=None,
+        ignore_projects=None,
+        ignore_tags=None,
+        year=None,
+        month=None,
+        week=None,
+        day=None,
+        full=None,
+    ):
+        """Return the frames given by log() and the span they were filtered by."""
         for start_time in (_ for _ in [day, week, month, year, full] if _ is not None):
             from_ = start_time
 
@@ -218,22 +306,28 @@ class TimeTracker:
         if current is None:
             current = self.config.getboolean("options", "include_current")
 
-        if self.is_started and current:
-            cur = self.current
-            self._frames.add(
-                cur["project"], cur["start"], arrow.now(), cur["tags"], id="current"
-            )
-
         span = Span(from_, to)
-        filtered_frames = self.frames(
+        filters = dict(
             projects=projects,
             tags=tags,
             ignore_projects=ignore_projects,
             ignore_tags=ignore_tags,
             span=span,
         )
+        filtered_frames = self.frames(**filters)
+
+        if self.is_started and current:
+            # the running frame goes through the same filters, without adding
+            # it to the stored frames
+            cur = self.current
+            running = Frame(
+                cur["start"], arrow.now(), cur["project"], "current", cur["tags"]
+            )
+            filtered_frames = itertools.chain(
+                filtered_frames, Frames([running]).filter(**filters)
+            )
 
-        return filtered_frames
+        return filtered_frames, span
 
     def report(
         self,
@@ -250,8 +344,9 @@ class TimeTracker:
         day=None,
         full=None,
     ):
-
-        filtered_frames = self.log(
+        # the report covers the span of the log, which starts at the given
+        # period (year, month...) if any
+        filtered_frames, span = self._log(
             from_,
             to,
             current=current,
@@ -266,18 +361,71 @@ class TimeTracker:
             full=full,
         )
 
-        frames_by_project = sorted_groupby(
-            filtered_frames, operator.attrgetter("project")
-        )
+        return self._build_report(filtered_frames, span, tags)
 
-        # After sorting by project, the filtered_frames generator has been
-        # consumed and this removal does not affect frames_by_project.
-        # That's why we don't delete the current frame inside log().
-        if self.is_started and current:
-            del self._frames["current"]
+    def aggregate(
+        self,
+        from_,
+        to,
+        current=None,
+        projects=None,
+        tags=None,
+        ignore_projects=None,
+        ignore_tags=None,
+    ):
+        """
+        Return a list of reports, one for each day between `from_` and `to`.
 
-        total = datetime.timedelta()
-        span = Span(from_, to)
+        Frames are filtered once for the whole interval and then assigned to
+        every day they overlap, clipped to that day.
+        """
+        days = [
+            Span(day, day)
+            for day in (
+                from_ + datetime.timedelta(days=i)
+                for i in range((to.datetime - from_.datetime).days + 1)
+            )
+        ]
+        if not days:
+            return []
+
+        day_stops = [day.stop_ts for day in days]
+        frames_by_day = [[] for _ in days]
+
+        for frame in self.log(
+            days[0].start,
+            days[-1].stop,
+            current=current,
+            projects=projects,
+            tags=tags,
+            ignore_projects=ignore_projects,
+            ignore_tags=ignore_tags,
+        ):
+            i = bisect.bisect_left(day_stops, frame.start_ts)
+            while i < len(days) and days[i].start_ts <= frame.stop_ts:
+                day = days[i]
+                if frame in day:
+                    frames_by_day[i].append(frame)
+                else:
+                    frames_by_day[i].append(
+                        frame.copy(
+                            start=max(frame.start_ts, day.start_ts),
+                            stop=min(frame.stop_ts, day.stop_ts),
+                        )
+                    )
+                i += 1
+
+        return [
+            self._build_report(frames, day, tags)
+            for day, frames in zip(days, frames_by_day)
+        ]
+
+    def _build_report(self, frames, span, tags=None):
+        frames_by_project = defaultdict(list)
+        for frame in frames:
+            frames_by_project[frame.project].append(frame)
+
+        total = 0
 
         report = {
             "timespan": {
@@ -287,49 +435,30 @@ class TimeTracker:
             "projects": [],
         }
 
-        for project, frames in frames_by_project:
-            frames = tuple(frames)
-            delta = reduce(
-                operator.add,
-                (f.stop.datetime - f.start.datetime for f in frames),
-                datetime.timedelta(),
-            )
+        tag_filter = set(tags) if tags else None
+
+        for project in sorted(frames_by_project):
+            # project and tag times are accumulated in a single pass
+            delta = 0
+            tag_deltas = defaultdict(int)
+            for frame in frames_by_project[project]:
+                frame_delta = frame.stop_ts - frame.start_ts
+                delta += frame_delta
+                for tag in set(frame.tags):
+                    if tag_filter is None or tag in tag_filter:
+                        tag_deltas[tag] += frame_delta
             total += delta
 
-            project_report = {
-                "name": project,
-                "time": delta.total_seconds(),
-                "tags": [],
-            }
-
-            if tags is None:
-                tags = []
-
-            tags_to_print = sorted(
-                set(
-                    tag
-                    for frame in frames
-                    for tag in frame.tags
-                    if tag in tags or not tags
-                )
+            report["projects"].append(
+                {
+                    "name": project,
+                    "time": float(delta),
+                    "tags": [
+                        {"name": tag, "time": float(tag_deltas[tag])}
+                        for tag in sorted(tag_deltas)
+                    ],
+                }
             )
 
-            for tag in tags_to_print:
-                delta = reduce(
-                    operator.add,
-                    (
-                        f.stop.datetime - f.start.datetime
-                        for f in frames
-                        if tag in f.tags
-                    ),
-                    datetime.timedelta(),
-                )
-
-                project_report["tags"].append(
-                    {"name": tag, "time": delta.total_seconds()}
-                )
-
-            report["projects"].append(project_report)
-
-        report["time"] = total.total_seconds()
+        report["time"] = float(total)
         return report